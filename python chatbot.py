@@ -1,9 +1,65 @@
+from __future__ import annotations
+
+import bisect
+import contextlib
+import csv
+import functools
+import gc
+import heapq
+import importlib.util
+import itertools
 import json
+import os
+import pickle
+import random
 import re
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass, field
+import signal
+import struct
+import sys
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict, deque
+from collections.abc import MutableMapping
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Any, Set, Tuple
+from dataclasses import dataclass, field, replace
 from enum import Enum
 
+if TYPE_CHECKING:
+    from concurrent.futures import ThreadPoolExecutor
+
+def _lazy_module(name: str, optional: bool = False):
+    """Modul yang baru benar-benar diimpor saat atributnya pertama kali dipakai
+
+    Dipakai untuk subsistem opsional (server, multi-proses, store, benchmark) agar
+    start-up mode CLI dan proses pendek tidak membayar biaya impornya. Dengan
+    optional=True, dependensi yang tidak terpasang menghasilkan None.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None and optional:
+        return None
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+asyncio = _lazy_module("asyncio")
+gzip = _lazy_module("gzip")
+mmap = _lazy_module("mmap")
+multiprocessing = _lazy_module("multiprocessing")
+sqlite3 = _lazy_module("sqlite3")
+tempfile = _lazy_module("tempfile")
+tracemalloc = _lazy_module("tracemalloc")
+# Dependensi opsional: hanya dibutuhkan oleh OrderAnalytics
+np = _lazy_module("numpy", optional=True)
+
 class ChatbotState(Enum):
     GREETING = "greeting"
     TAKING_ORDER = "taking_order"
@@ -11,73 +67,771 @@ class ChatbotState(Enum):
     WAITING_HUMAN = "waiting_human"
     ORDER_COMPLETE = "order_complete"
 
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+def tokenize(text: str) -> List[str]:
+    """Memecah teks menjadi token huruf/angka lowercase"""
+    return _TOKEN_RE.findall(text.lower())
+
+# Kata kunci perintah per intent
+INTENT_KEYWORDS = {
+    "menu": ['menu', 'daftar', 'katalog', 'pilihan'],
+    "show_order": ['pesanan', 'order', 'keranjang', 'list'],
+    "confirm_order": ['konfirmasi', 'confirm', 'pesan', 'bayar', 'selesai'],
+    "clear_order": ['hapus semua', 'clear', 'reset', 'bersihkan'],
+    "yes": ['ya', 'yes', 'benar', 'ok', 'oke', 'lanjut'],
+    "no": ['tidak', 'no', 'batal', 'ubah'],
+}
+
+# Kata kunci modifier per grup; jika beberapa cocok, nilai yang lebih awal menang
+MODIFIER_KEYWORDS = {
+    "ukuran": [("large", ['large', 'besar', 'jumbo']), ("small", ['small', 'kecil'])],
+    "susu": [("soy", ['soy', 'kedelai']), ("almond", ['almond']), ("oat", ['oat'])],
+    "gula": [("tanpa_gula", ['tanpa gula', 'no sugar', 'sugar free']), ("extra_manis", ['extra manis', 'very sweet'])],
+    "suhu": [("dingin", ['es', 'dingin', 'cold', 'iced']), ("panas", ['panas', 'hot'])],
+}
+
+# Nilai modifier jika grup tidak disebut
+DEFAULT_MODIFIERS = {"ukuran": "medium"}
+
+# Kata bilangan untuk jumlah pesanan ("dua latte", "dua puluh lima croissant")
+NUMBER_WORDS = {
+    "satu": 1, "dua": 2, "tiga": 3, "empat": 4, "lima": 5,
+    "enam": 6, "tujuh": 7, "delapan": 8, "sembilan": 9,
+    "sepuluh": 10, "sebelas": 11, "seratus": 100,
+    "belas": 0, "puluh": 0, "ratus": 0,
+}
+# Jumlah dalam angka: "2", "x2", "2x"
+_QUANTITY_RE = re.compile(r"x?(\d+)x?")
+# Batas porsi per sebutan item dan per baris keranjang; angka lebih besar dipotong ke sini
+MAX_QUANTITY = 99
+
+def read_quantity(tokens: List[str], i: int) -> Tuple[int, int]:
+    """Membaca jumlah mulai token ke-i: (banyak token terpakai, nilai); (0, 0) jika bukan jumlah
+
+    Nilai dipotong ke MAX_QUANTITY; angka 0 tidak dihitung sebagai jumlah.
+    """
+    match = _QUANTITY_RE.fullmatch(tokens[i])
+    if match:
+        digits = match.group(1).lstrip("0")
+        if not digits:
+            return 0, 0
+        # Angka sangat panjang tidak perlu dikonversi penuh
+        return 1, min(int(digits), MAX_QUANTITY) if len(digits) <= 6 else MAX_QUANTITY
+    total = current = 0
+    j = i
+    while j < len(tokens):
+        token = tokens[j]
+        value = NUMBER_WORDS.get(token)
+        if value is None:
+            break
+        if token == "belas" and 0 < current < 10:
+            current += 10
+        elif token == "puluh" and 0 < current < 10:
+            current *= 10
+        elif token == "ratus" and 0 < current < 10 and total == 0:
+            total, current = current * 100, 0
+        elif token == "seratus" and total == 0 and current == 0:
+            total = 100
+        elif 0 < value < 100 and current % 10 == 0 and (value < 10 or current == 0):
+            current += value
+        else:
+            break
+        j += 1
+    return j - i, min(total + current, MAX_QUANTITY)
+
+# Kata kunci kategori untuk saran menu dan menu per kategori
+CATEGORY_KEYWORDS = {
+    "kopi": ['kopi', 'coffee'],
+    "teh": ['teh', 'tea'],
+    "dingin": ['minuman dingin'],
+    "makanan": ['makanan', 'makan', 'food'],
+    "snack": ['snack', 'camilan'],
+}
+
+CATEGORY_NAMES = {
+    "kopi": "☕ KOPI",
+    "teh": "🍵 TEH",
+    "dingin": "🧊 MINUMAN DINGIN",
+    "makanan": "🍽️ MAKANAN",
+    "snack": "🍪 SNACK"
+}
+
 @dataclass
+class IntentResult:
+    """Hasil klasifikasi satu pesan: intent, modifier, dan kategori yang disebut"""
+    intents: Set[str] = field(default_factory=set)
+    modifiers: Dict[str, str] = field(default_factory=dict)
+    categories: List[str] = field(default_factory=list)
+    
+    def has(self, intent: str) -> bool:
+        return intent in self.intents
+    
+    def modifier_list(self) -> List[str]:
+        """Modifier dalam urutan grup MODIFIER_KEYWORDS, termasuk nilai default"""
+        modifiers = []
+        for group in MODIFIER_KEYWORDS:
+            value = self.modifiers.get(group, DEFAULT_MODIFIERS.get(group))
+            if value:
+                modifiers.append(value)
+        return modifiers
+
+class IntentMatcher:
+    """Pencocok kata kunci sekali jalan dengan satu regex gabungan berbatas kata"""
+    def __init__(self, intents: Dict[str, List[str]], modifiers: Dict[str, List[Tuple[str, List[str]]]],
+                 categories: Dict[str, List[str]]):
+        # frasa -> daftar (jenis, kunci, nilai, prioritas)
+        self._phrases: Dict[str, List[Tuple[str, str, str, int]]] = {}
+        for intent, words in intents.items():
+            for word in words:
+                self._phrases.setdefault(word, []).append(("intent", intent, intent, 0))
+        for group, options in modifiers.items():
+            for rank, (value, words) in enumerate(options):
+                for word in words:
+                    self._phrases.setdefault(word, []).append(("modifier", group, value, rank))
+        for category, words in categories.items():
+            for word in words:
+                self._phrases.setdefault(word, []).append(("category", category, category, 0))
+        # Frasa terpanjang diletakkan lebih dulu agar "no sugar" menang atas "no"
+        alternation = "|".join(re.escape(phrase) for phrase in sorted(self._phrases, key=len, reverse=True))
+        self._pattern = re.compile(rf"(?<!\w)(?:{alternation})(?!\w)")
+        # Frasa yang sama dalam bentuk tuple token, untuk parser span di parse_message
+        self._token_phrases = {tuple(tokenize(phrase)): entries for phrase, entries in self._phrases.items()}
+        self._max_phrase_len = max(len(phrase) for phrase in self._token_phrases)
+    
+    def classify(self, text: str) -> IntentResult:
+        result = IntentResult()
+        ranks: Dict[str, int] = {}
+        for match in self._pattern.finditer(text.lower()):
+            for kind, key, value, rank in self._phrases[match.group()]:
+                if kind == "intent":
+                    result.intents.add(key)
+                elif kind == "modifier":
+                    if rank < ranks.get(key, len(MODIFIER_KEYWORDS[key])):
+                        ranks[key] = rank
+                        result.modifiers[key] = value
+                elif key not in result.categories:
+                    result.categories.append(key)
+        return result
+    
+    def match_span(self, tokens: List[str], i: int) -> Tuple[int, List[Tuple[str, str, str, int]]]:
+        """Kata kunci terpanjang mulai token ke-i: (panjang span, entri frasa); (0, []) jika tidak ada"""
+        for n in range(min(self._max_phrase_len, len(tokens) - i), 0, -1):
+            entries = self._token_phrases.get(tuple(tokens[i:i + n]))
+            if entries:
+                return n, entries
+        return 0, []
+
+    @functools.cached_property
+    def keyword_tokens(self) -> Set[str]:
+        """Semua token yang dipakai kata kunci (tidak perlu dikoreksi typo)"""
+        return {token for phrase in self._phrases for token in tokenize(phrase)}
+
+INTENT_MATCHER = IntentMatcher(INTENT_KEYWORDS, MODIFIER_KEYWORDS, CATEGORY_KEYWORDS)
+
+# Kosakata modifier tetap; urutan grup juga urutan tampilan di ringkasan pesanan
+MODIFIER_GROUPS = {
+    "ukuran": ["small", "medium", "large"],
+    "susu": ["soy", "almond", "oat", "regular"],
+    "gula": ["tanpa_gula", "gula_sedikit", "gula_normal", "extra_manis"],
+    "suhu": ["panas", "dingin", "es"],
+    "extra": ["extra_shot", "decaf", "extra_foam", "no_foam"]
+}
+MODIFIER_VOCAB = tuple(value for values in MODIFIER_GROUPS.values() for value in values)
+_MODIFIER_BITS = {value: 1 << i for i, value in enumerate(MODIFIER_VOCAB)}
+
+def encode_modifiers(modifiers: List[str]) -> int:
+    """Mengubah daftar modifier menjadi bitmask terhadap MODIFIER_VOCAB"""
+    mask = 0
+    for modifier in modifiers:
+        try:
+            mask |= _MODIFIER_BITS[modifier]
+        except KeyError:
+            raise ValueError(f"Modifier tidak dikenal: {modifier}") from None
+    return mask
+
+def decode_modifiers(mask: int) -> List[str]:
+    """Mengubah bitmask kembali menjadi daftar modifier (urutan MODIFIER_VOCAB)"""
+    return [value for value in MODIFIER_VOCAB if mask & _MODIFIER_BITS[value]]
+
+@dataclass(frozen=True, slots=True)
 class MenuItem:
     id: str
     name: str
-    price: float
+    price: int  # Rupiah (bilangan bulat)
     category: str
     description: str = ""
     available: bool = True
+    prep_time: int = 0  # Detik per porsi; 0 = pakai default stasiun dapur
 
-@dataclass
+@dataclass(slots=True)
 class OrderItem:
     menu_item: MenuItem
     quantity: int = 1
-    modifiers: List[str] = field(default_factory=list)
+    modifier_mask: int = 0  # Bitmask terhadap MODIFIER_VOCAB
     special_requests: str = ""
+    
+    @property
+    def modifiers(self) -> List[str]:
+        return decode_modifiers(self.modifier_mask)
+    
+    @property
+    def key(self) -> Tuple[str, int, str]:
+        return line_key(self.menu_item.id, self.modifier_mask, self.special_requests)
+    
+    @property
+    def subtotal(self) -> int:
+        return self.menu_item.price * self.quantity
+    
+    def render(self) -> str:
+        """Teks ringkasan baris ini (tanpa nomor urut)"""
+        return render_line(self.menu_item.name, self.menu_item.price, self.quantity,
+                           self.modifier_mask, self.special_requests)
 
-@dataclass
+# Teks baris di-cache di luar keranjang sesi: LRU terbatas yang dipakai bersama semua sesi,
+# sehingga keranjang yang terbuka tidak ikut menyimpan teks ringkasannya
+LINE_RENDER_CACHE_SIZE = 4096
+
+@functools.lru_cache(maxsize=LINE_RENDER_CACHE_SIZE)
+def render_line(name: str, price: int, quantity: int, modifier_mask: int, special_requests: str) -> str:
+    parts = [f"{name} x{quantity}\n", f"   Harga: Rp {price:,.0f}\n"]
+    modifiers = decode_modifiers(modifier_mask)
+    if modifiers:
+        parts.append(f"   Modifikasi: {', '.join(modifiers)}\n")
+    if special_requests:
+        parts.append(f"   Catatan: {special_requests}\n")
+    parts.append(f"   Subtotal: Rp {price * quantity:,.0f}\n")
+    parts.append("-" * 25 + "\n")
+    return "".join(parts)
+
+def line_key(item_id: str, modifier_mask: int, special_requests: str) -> Tuple[str, int, str]:
+    """Kunci kanonik baris pesanan: item, bitmask modifier, dan catatan"""
+    return (item_id, modifier_mask, special_requests.strip())
+
+# Di bawah batas ini baris dicari secara linear; lebih hemat memori untuk keranjang kecil
+LINE_INDEX_THRESHOLD = 8
+
+@dataclass(slots=True)
 class Order:
     items: List[OrderItem] = field(default_factory=list)
     customer_name: str = ""
-    total: float = 0.0
+    total: int = 0  # Rupiah, diperbarui secara inkremental
     order_id: str = ""
+    # line_key -> OrderItem untuk penggabungan baris O(1); dibuat saat baris > LINE_INDEX_THRESHOLD
+    lines: Optional[Dict[Tuple[str, int, str], OrderItem]] = field(default=None, repr=False)
+
+# Ambang pencocokan typo: skor = 1 - jarak_edit / panjang kata terpanjang
+FUZZY_MAX_DISTANCE = 2
+FUZZY_ACCEPT_THRESHOLD = 0.75
+FUZZY_SUGGEST_THRESHOLD = 0.5
+FUZZY_MAX_CANDIDATES = 32
+
+def trigrams(term: str) -> Set[str]:
+    padded = f"${term}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def bounded_levenshtein(a: str, b: str, max_distance: int) -> int:
+    """Jarak edit a-b; berhenti lebih awal dan mengembalikan max_distance + 1 jika melebihi batas"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return min(previous[-1], max_distance + 1)
+
+CATALOG_MAGIC = b"KAFECAT2"
+_CATALOG_SECTIONS = ("outlet_off", "outlet_blob", "id_off", "id_blob", "name_off", "name_blob",
+                     "category_off", "category_blob", "desc_off", "desc_blob", "prices", "available", "id_order",
+                     "prep_times")
+_CATALOG_HEADER = struct.Struct("<8sII" + "QQ" * len(_CATALOG_SECTIONS))
+
+def _read_catalog_source(path: str) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Membaca katalog JSON/CSV menjadi (daftar outlet, daftar item dengan harga per outlet)
+
+    JSON: list item atau {"items": [...]}; tiap item punya "price" atau "prices": {outlet: harga}.
+    CSV : kolom id,name,category,description,available dan "price" atau "price_<outlet>".
+    Kolom/field "prep_time" (detik per porsi) opsional.
+    """
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = []
+            for row in csv.DictReader(f):
+                prices = {}
+                for column, value in row.items():
+                    if column == "price" and value:
+                        prices["default"] = int(value)
+                    elif column.startswith("price_") and value:
+                        prices[column[len("price_"):]] = int(value)
+                row["prices"] = prices
+                row["available"] = row.get("available", "1").strip().lower() not in ("0", "false", "tidak", "no")
+                rows.append(row)
+    else:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        rows = data["items"] if isinstance(data, dict) else data
+        for row in rows:
+            prices = {outlet: int(price) for outlet, price in row.get("prices", {}).items()}
+            if "price" in row:
+                prices.setdefault("default", int(row["price"]))
+            row["prices"] = prices
+    
+    outlets: List[str] = []
+    for row in rows:
+        if "id" not in row or "name" not in row or not row["prices"]:
+            raise ValueError(f"Item katalog tidak lengkap: {row}")
+        for outlet in row["prices"]:
+            if outlet not in outlets:
+                outlets.append(outlet)
+    return outlets, rows
+
+def build_catalog(source_path: str, output_path: str) -> int:
+    """Mengubah katalog JSON/CSV menjadi file biner kolumnar; mengembalikan jumlah item"""
+    outlets, rows = _read_catalog_source(source_path)
+    ids = [str(row["id"]) for row in rows]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Katalog berisi ID item duplikat")
+    
+    def string_column(values: List[str]) -> Tuple[bytes, bytes]:
+        offsets = array("I", [0])
+        blob = bytearray()
+        for value in values:
+            blob += value.encode("utf-8")
+            offsets.append(len(blob))
+        return offsets.tobytes(), bytes(blob)
+    
+    # Harga -1 berarti item tidak dijual di outlet tersebut
+    prices = array("q", (row["prices"].get(outlet, -1) for row in rows for outlet in outlets))
+    id_order = array("I", sorted(range(len(rows)), key=lambda row: ids[row].encode("utf-8")))
+    sections = [
+        *string_column(outlets),
+        *string_column(ids),
+        *string_column([str(row["name"]) for row in rows]),
+        *string_column([str(row.get("category", "")) for row in rows]),
+        *string_column([str(row.get("description") or "") for row in rows]),
+        prices.tobytes(),
+        bytes(1 if row.get("available", True) else 0 for row in rows),
+        id_order.tobytes(),
+        array("I", (int(row.get("prep_time") or 0) for row in rows)).tobytes(),
+    ]
+    
+    def align(offset: int) -> int:
+        return (offset + 7) & ~7
+    
+    table = []
+    offset = align(_CATALOG_HEADER.size)
+    for data in sections:
+        table.extend((offset, len(data)))
+        offset = align(offset + len(data))
+    
+    # Tulis ke file sementara lalu ganti, agar pembaca tidak pernah melihat file setengah jadi
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_CATALOG_HEADER.pack(CATALOG_MAGIC, len(rows), len(outlets), *table))
+        for (start, _), data in zip(zip(table[::2], table[1::2]), sections):
+            f.seek(start)
+            f.write(data)
+        f.truncate(offset)
+    os.replace(tmp_path, output_path)
+    return len(rows)
+
+class CatalogFile:
+    """Katalog biner kolumnar yang di-mmap; kolom dibaca langsung tanpa parsing seluruh file"""
+    def __init__(self, path: str, outlet: Optional[str] = None):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic = self._mmap[:len(CATALOG_MAGIC)]
+        if magic != CATALOG_MAGIC:
+            if magic[:-1] == CATALOG_MAGIC[:-1]:
+                raise ValueError(f"Versi file katalog lama, bangun ulang dengan build_catalog: {path}")
+            raise ValueError(f"Bukan file katalog Kafe Digital: {path}")
+        header = _CATALOG_HEADER.unpack_from(self._mmap, 0)
+        self.item_count, self._outlet_count = header[1], header[2]
+        view = memoryview(self._mmap)
+        sections = {}
+        for i, name in enumerate(_CATALOG_SECTIONS):
+            start, length = header[3 + 2 * i], header[4 + 2 * i]
+            sections[name] = view[start:start + length]
+        self._columns = {
+            column: (sections[f"{column}_off"].cast("I"), sections[f"{column}_blob"])
+            for column in ("outlet", "id", "name", "category", "desc")
+        }
+        self._prices = sections["prices"].cast("q")
+        self._available = sections["available"]
+        self._id_order = sections["id_order"].cast("I")
+        self._prep_times = sections["prep_times"].cast("I")
+        
+        self.outlets = [self._string("outlet", i) for i in range(self._outlet_count)]
+        if outlet is None:
+            self.outlet = 0
+        elif outlet in self.outlets:
+            self.outlet = self.outlets.index(outlet)
+        else:
+            raise ValueError(f"Outlet '{outlet}' tidak ada di katalog")
+    
+    def __getstate__(self) -> Dict[str, Any]:
+        # Snapshot hanya menyimpan lokasi file; mmap dibuka ulang saat dimuat
+        return {"path": self.path, "outlet": self.outlets[self.outlet]}
+    
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__init__(state["path"], state["outlet"])
+    
+    def _string(self, column: str, row: int) -> str:
+        offsets, blob = self._columns[column]
+        return bytes(blob[offsets[row]:offsets[row + 1]]).decode("utf-8")
+    
+    def item_id(self, row: int) -> str:
+        return self._string("id", row)
+    
+    def price(self, row: int) -> int:
+        return self._prices[row * self._outlet_count + self.outlet]
+    
+    def is_available(self, row: int) -> bool:
+        return bool(self._available[row]) and self.price(row) >= 0
+    
+    def find_row(self, item_id: str) -> Optional[int]:
+        """Binary search di kolom id yang terurut"""
+        key = item_id.encode("utf-8")
+        offsets, blob = self._columns["id"]
+        lo, hi = 0, self.item_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            row = self._id_order[mid]
+            candidate = bytes(blob[offsets[row]:offsets[row + 1]])
+            if candidate < key:
+                lo = mid + 1
+            elif candidate > key:
+                hi = mid
+            else:
+                return row
+        return None
+    
+    def index_row(self, row: int) -> Tuple[str, str, str, bool]:
+        """(id, nama, deskripsi, tersedia) tanpa membuat MenuItem, untuk membangun index"""
+        return self.item_id(row), self._string("name", row), self._string("desc", row), self.is_available(row)
+    
+    def materialize(self, row: int) -> "MenuItem":
+        return MenuItem(self.item_id(row), self._string("name", row), self.price(row),
+                        self._string("category", row), self._string("desc", row), self.is_available(row),
+                        self._prep_times[row])
+
+class LazyMenu(MutableMapping):
+    """Mapping id -> MenuItem di atas CatalogFile; MenuItem dibuat saat pertama diakses"""
+    def __init__(self, catalog: CatalogFile):
+        self.catalog = catalog
+        self._items: Dict[str, MenuItem] = {}  # item yang sudah dibuat atau ditambah/diganti
+        self._deleted: Set[str] = set()  # id katalog yang dihapus
+        self._extra: Set[str] = set()  # id yang tidak ada di katalog
+    
+    def __getitem__(self, item_id: str) -> MenuItem:
+        item = self._items.get(item_id)
+        if item is not None:
+            return item
+        row = None if item_id in self._deleted else self.catalog.find_row(item_id)
+        if row is None:
+            raise KeyError(item_id)
+        item = self._items[item_id] = self.catalog.materialize(row)
+        return item
+    
+    def __contains__(self, item_id: object) -> bool:
+        if item_id in self._items:
+            return True
+        return isinstance(item_id, str) and item_id not in self._deleted and self.catalog.find_row(item_id) is not None
+    
+    def __setitem__(self, item_id: str, item: MenuItem):
+        if item_id in self._deleted:
+            self._deleted.discard(item_id)
+        elif self.catalog.find_row(item_id) is None:
+            self._extra.add(item_id)
+        self._items[item_id] = item
+    
+    def __delitem__(self, item_id: str):
+        if item_id not in self:
+            raise KeyError(item_id)
+        self._items.pop(item_id, None)
+        if item_id in self._extra:
+            self._extra.discard(item_id)
+        else:
+            self._deleted.add(item_id)
+    
+    def __iter__(self):
+        for row in range(self.catalog.item_count):
+            item_id = self.catalog.item_id(row)
+            if item_id not in self._deleted:
+                yield item_id
+        yield from list(self._extra)
+    
+    def __len__(self) -> int:
+        return self.catalog.item_count - len(self._deleted) + len(self._extra)
+    
+    def iter_index_rows(self):
+        """(id, nama, deskripsi, tersedia) untuk semua item, tanpa membuat MenuItem baru"""
+        for row in range(self.catalog.item_count):
+            item_id = self.catalog.item_id(row)
+            if item_id in self._deleted:
+                continue
+            item = self._items.get(item_id)
+            if item is not None:
+                yield item.id, item.name, item.description, item.available
+            else:
+                yield self.catalog.index_row(row)
+        for item_id in list(self._extra):
+            item = self._items[item_id]
+            yield item.id, item.name, item.description, item.available
 
 class MenuManager:
-    def __init__(self):
-        self.menu = {
+    def __init__(self, catalog: Optional[CatalogFile] = None):
+        self.menu: MutableMapping = {
             # Kopi
-            "espresso": MenuItem("espresso", "Espresso", 15000, "kopi", "Kopi hitam pekat dengan rasa kuat"),
-            "americano": MenuItem("americano", "Americano", 18000, "kopi", "Espresso dengan air panas"),
-            "cappuccino": MenuItem("cappuccino", "Cappuccino", 25000, "kopi", "Espresso dengan susu berbusa"),
-            "latte": MenuItem("latte", "Caffe Latte", 28000, "kopi", "Espresso dengan susu steamed"),
-            "macchiato": MenuItem("macchiato", "Macchiato", 26000, "kopi", "Espresso dengan sedikit susu berbusa"),
-            "mocha": MenuItem("mocha", "Mocha", 32000, "kopi", "Latte dengan sirup coklat"),
-            "kopi_susu": MenuItem("kopi_susu", "Kopi Susu Tradisional", 20000, "kopi", "Kopi robusta dengan susu kental manis"),
+            "espresso": MenuItem("espresso", "Espresso", 15000, "kopi", "Kopi hitam pekat dengan rasa kuat", prep_time=60),
+            "americano": MenuItem("americano", "Americano", 18000, "kopi", "Espresso dengan air panas", prep_time=90),
+            "cappuccino": MenuItem("cappuccino", "Cappuccino", 25000, "kopi", "Espresso dengan susu berbusa", prep_time=150),
+            "latte": MenuItem("latte", "Caffe Latte", 28000, "kopi", "Espresso dengan susu steamed", prep_time=150),
+            "macchiato": MenuItem("macchiato", "Macchiato", 26000, "kopi", "Espresso dengan sedikit susu berbusa", prep_time=120),
+            "mocha": MenuItem("mocha", "Mocha", 32000, "kopi", "Latte dengan sirup coklat", prep_time=180),
+            "kopi_susu": MenuItem("kopi_susu", "Kopi Susu Tradisional", 20000, "kopi", "Kopi robusta dengan susu kental manis", prep_time=120),
             
             # Teh
-            "teh_tarik": MenuItem("teh_tarik", "Teh Tarik", 15000, "teh", "Teh dengan susu yang ditarik"),
-            "teh_hijau": MenuItem("teh_hijau", "Teh Hijau", 12000, "teh", "Teh hijau segar"),
-            "thai_tea": MenuItem("thai_tea", "Thai Tea", 18000, "teh", "Teh Thailand dengan susu"),
-            "es_teh": MenuItem("es_teh", "Es Teh Manis", 10000, "teh", "Teh manis dingin"),
+            "teh_tarik": MenuItem("teh_tarik", "Teh Tarik", 15000, "teh", "Teh dengan susu yang ditarik", prep_time=120),
+            "teh_hijau": MenuItem("teh_hijau", "Teh Hijau", 12000, "teh", "Teh hijau segar", prep_time=90),
+            "thai_tea": MenuItem("thai_tea", "Thai Tea", 18000, "teh", "Teh Thailand dengan susu", prep_time=120),
+            "es_teh": MenuItem("es_teh", "Es Teh Manis", 10000, "teh", "Teh manis dingin", prep_time=60),
             
             # Minuman Dingin
-            "es_kopi_susu": MenuItem("es_kopi_susu", "Es Kopi Susu", 22000, "dingin", "Kopi susu dingin dengan es"),
-            "iced_latte": MenuItem("iced_latte", "Iced Latte", 30000, "dingin", "Latte dingin dengan es"),
-            "cold_brew": MenuItem("cold_brew", "Cold Brew", 25000, "dingin", "Kopi seduh dingin 12 jam"),
-            "frappuccino": MenuItem("frappuccino", "Frappuccino", 35000, "dingin", "Minuman kopi blended dengan es"),
+            "es_kopi_susu": MenuItem("es_kopi_susu", "Es Kopi Susu", 22000, "dingin", "Kopi susu dingin dengan es", prep_time=120),
+            "iced_latte": MenuItem("iced_latte", "Iced Latte", 30000, "dingin", "Latte dingin dengan es", prep_time=120),
+            "cold_brew": MenuItem("cold_brew", "Cold Brew", 25000, "dingin", "Kopi seduh dingin 12 jam", prep_time=45),
+            "frappuccino": MenuItem("frappuccino", "Frappuccino", 35000, "dingin", "Minuman kopi blended dengan es", prep_time=180),
             
             # Makanan
-            "croissant": MenuItem("croissant", "Croissant", 18000, "makanan", "Roti pastry Prancis"),
-            "sandwich": MenuItem("sandwich", "Sandwich Club", 35000, "makanan", "Sandwich dengan daging dan sayuran"),
-            "pasta": MenuItem("pasta", "Pasta Carbonara", 45000, "makanan", "Pasta dengan saus krim dan bacon"),
-            "nasi_goreng": MenuItem("nasi_goreng", "Nasi Goreng Spesial", 28000, "makanan", "Nasi goreng dengan telur dan ayam"),
-            "cake": MenuItem("cake", "Slice Cake Coklat", 22000, "makanan", "Kue coklat lembut"),
+            "croissant": MenuItem("croissant", "Croissant", 18000, "makanan", "Roti pastry Prancis", prep_time=120),
+            "sandwich": MenuItem("sandwich", "Sandwich Club", 35000, "makanan", "Sandwich dengan daging dan sayuran", prep_time=300),
+            "pasta": MenuItem("pasta", "Pasta Carbonara", 45000, "makanan", "Pasta dengan saus krim dan bacon", prep_time=600),
+            "nasi_goreng": MenuItem("nasi_goreng", "Nasi Goreng Spesial", 28000, "makanan", "Nasi goreng dengan telur dan ayam", prep_time=480),
+            "cake": MenuItem("cake", "Slice Cake Coklat", 22000, "makanan", "Kue coklat lembut", prep_time=60),
             
             # Snack
-            "cookies": MenuItem("cookies", "Cookies Choco Chip", 15000, "snack", "Kue kering coklat chip"),
-            "muffin": MenuItem("muffin", "Blueberry Muffin", 20000, "snack", "Muffin dengan blueberry"),
-            "donut": MenuItem("donut", "Glazed Donut", 12000, "snack", "Donut glazur manis")
-        }
+            "cookies": MenuItem("cookies", "Cookies Choco Chip", 15000, "snack", "Kue kering coklat chip", prep_time=30),
+            "muffin": MenuItem("muffin", "Blueberry Muffin", 20000, "snack", "Muffin dengan blueberry", prep_time=60),
+            "donut": MenuItem("donut", "Glazed Donut", 12000, "snack", "Donut glazur manis", prep_time=30)
+        } if catalog is None else LazyMenu(catalog)
         
-        self.modifiers = {
-            "susu": ["soy", "almond", "oat", "regular"],
-            "gula": ["tanpa_gula", "gula_sedikit", "gula_normal", "extra_manis"],
-            "ukuran": ["small", "medium", "large"],
-            "suhu": ["panas", "dingin", "es"],
-            "extra": ["extra_shot", "decaf", "extra_foam", "no_foam"]
-        }
+        self.modifiers = MODIFIER_GROUPS
+        
+        # Index pencarian: token nama -> id item, frasa (nama lengkap / alias id) -> id item.
+        # Dibangun saat pertama dipakai agar start-up dengan katalog besar tetap cepat
+        self._token_index: Dict[str, Set[str]] = {}
+        self._desc_index: Dict[str, Set[str]] = {}
+        self._phrase_index: Dict[Tuple[str, ...], List[str]] = {}
+        self._max_phrase_len = 1
+        # Index trigram -> token nama, untuk pencocokan typo tanpa membandingkan semua item
+        self._trigram_index: Dict[str, Set[str]] = {}
+        self._correction_cache: Dict[Tuple[str, float], str] = {}
+        self._index_ready = False
+        
+        # Naik setiap kali katalog/ketersediaan berubah; cache render mengikuti versi ini
+        self.version = 0
+        self._render_cache: Dict[Optional[str], str] = {}
+        # Cache hasil parse_message, dikosongkan saat katalog berubah
+        self.parse_cache = ParseCache()
+    
+    def __getstate__(self) -> Dict[str, Any]:
+        # Index ikut disimpan (itulah yang mahal dibangun); cache dan lock tidak
+        state = self.__dict__.copy()
+        state["_render_cache"] = {}
+        state["_correction_cache"] = {}
+        state["parse_cache"] = self.parse_cache.maxsize
+        return state
+    
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self.parse_cache = ParseCache(state["parse_cache"])
+    
+    def _catalog_changed(self):
+        self.version += 1
+        self._render_cache.clear()
+        self._correction_cache.clear()
+        self.parse_cache.clear()
+    
+    def _ensure_index(self):
+        if self._index_ready:
+            return
+        if isinstance(self.menu, LazyMenu):
+            rows = self.menu.iter_index_rows()
+        else:
+            rows = ((item.id, item.name, item.description, item.available) for item in self.menu.values())
+        for item_id, name, description, available in rows:
+            if available:
+                self._index_item(item_id, name, description)
+        self._index_ready = True
+    
+    def _index_item(self, item_id: str, name: str, description: str):
+        for phrase in {tuple(tokenize(name)), tuple(tokenize(item_id))}:
+            self._phrase_index.setdefault(phrase, []).append(item_id)
+            self._max_phrase_len = max(self._max_phrase_len, len(phrase))
+        for token in tokenize(name):
+            if token not in self._token_index:
+                self._token_index[token] = set()
+                for gram in trigrams(token):
+                    self._trigram_index.setdefault(gram, set()).add(token)
+            self._token_index[token].add(item_id)
+        for token in tokenize(description):
+            self._desc_index.setdefault(token, set()).add(item_id)
+    
+    def _unindex_item(self, item_id: str, name: str, description: str):
+        for phrase in {tuple(tokenize(name)), tuple(tokenize(item_id))}:
+            ids = self._phrase_index.get(phrase, [])
+            if item_id in ids:
+                ids.remove(item_id)
+            if not ids:
+                self._phrase_index.pop(phrase, None)
+        for index, text in ((self._token_index, name), (self._desc_index, description)):
+            for token in tokenize(text):
+                ids = index.get(token)
+                if ids is not None:
+                    ids.discard(item_id)
+                    if not ids:
+                        del index[token]
+                        if index is self._token_index:
+                            for gram in trigrams(token):
+                                terms = self._trigram_index.get(gram)
+                                if terms is not None:
+                                    terms.discard(token)
+                                    if not terms:
+                                        del self._trigram_index[gram]
+    
+    def add_item(self, item: MenuItem):
+        """Menambah (atau mengganti) item menu dan memperbarui index"""
+        self.remove_item(item.id)
+        self.menu[item.id] = item
+        if item.available and self._index_ready:
+            self._index_item(item.id, item.name, item.description)
+        self._catalog_changed()
+    
+    def remove_item(self, item_id: str) -> Optional[MenuItem]:
+        """Menghapus item menu dan mengeluarkannya dari index"""
+        item = self.menu.pop(item_id, None)
+        if item is not None:
+            if item.available and self._index_ready:
+                self._unindex_item(item.id, item.name, item.description)
+            self._catalog_changed()
+        return item
+    
+    def set_available(self, item_id: str, available: bool) -> bool:
+        """Mengubah ketersediaan item; index hanya diperbarui jika status berubah
+
+        Item berharga negatif tidak dijual di outlet ini dan tidak bisa diaktifkan.
+        """
+        item = self.menu.get(item_id)
+        if item is None or (available and item.price < 0):
+            return False
+        if item.available != available:
+            # MenuItem immutable: ganti dengan salinan berstatus baru
+            item = self.menu[item_id] = replace(item, available=available)
+            if self._index_ready:
+                if available:
+                    self._index_item(item.id, item.name, item.description)
+                else:
+                    self._unindex_item(item.id, item.name, item.description)
+            self._catalog_changed()
+        return True
+    
+    def fuzzy_terms(self, token: str, max_distance: int = FUZZY_MAX_DISTANCE) -> List[Tuple[str, float]]:
+        """Token nama yang mirip dengan token (typo), urut dari skor tertinggi"""
+        self._ensure_index()
+        grams = trigrams(token)
+        overlap: Dict[str, int] = {}
+        for gram in grams:
+            for term in self._trigram_index.get(gram, ()):
+                overlap[term] = overlap.get(term, 0) + 1
+        # Satu edit merusak paling banyak 3 trigram; kata pendek cukup berbagi 1 trigram
+        min_overlap = max(1 if len(token) <= 4 else 2, len(grams) - 3 * max_distance)
+        candidates = [term for term, count in overlap.items()
+                      if count >= min_overlap and abs(len(term) - len(token)) <= max_distance]
+        # Hanya kandidat dengan trigram bersama terbanyak yang dihitung jarak editnya
+        candidates = heapq.nlargest(FUZZY_MAX_CANDIDATES, candidates, key=lambda term: (overlap[term], term))
+        results = []
+        for term in candidates:
+            distance = bounded_levenshtein(token, term, max_distance)
+            if distance <= max_distance:
+                results.append((term, 1 - distance / max(len(token), len(term))))
+        results.sort(key=lambda result: (-result[1], result[0]))
+        return results
+    
+    def _correct_token(self, token: str, threshold: float) -> str:
+        if (len(token) < 4 or token.isdigit() or token in self._token_index
+                or token in INTENT_MATCHER.keyword_tokens or token in NUMBER_WORDS):
+            return token
+        # Kata umum ("saya", "tambah") muncul terus; simpan hasil koreksi sampai katalog berubah
+        key = (token, threshold)
+        corrected = self._correction_cache.get(key)
+        if corrected is None:
+            candidates = self.fuzzy_terms(token)
+            corrected = candidates[0][0] if candidates and candidates[0][1] >= threshold else token
+            if len(self._correction_cache) >= 10000:
+                self._correction_cache.clear()
+            self._correction_cache[key] = corrected
+        return corrected
+    
+    def suggest_items(self, text: str, threshold: float = FUZZY_SUGGEST_THRESHOLD, limit: int = 3) -> List[MenuItem]:
+        """Item dengan nama mirip kata-kata di teks, untuk saran saat tidak ada yang cocok"""
+        scores: Dict[str, float] = {}
+        for token in tokenize(text):
+            if len(token) < 4 or token.isdigit() or token in INTENT_MATCHER.keyword_tokens or token in NUMBER_WORDS:
+                continue
+            for term, score in self.fuzzy_terms(token):
+                if score < threshold:
+                    break
+                for item_id in self._token_index.get(term, ()):
+                    scores[item_id] = max(scores.get(item_id, 0.0), score)
+        ranked = sorted(scores, key=lambda item_id: (-scores[item_id], item_id))[:limit]
+        return [self.menu[item_id] for item_id in ranked]
+    
+    def correct_tokens(self, tokens: List[str], threshold: float) -> List[str]:
+        """Mengoreksi token typo ke token nama item termirip (skor >= threshold)"""
+        self._ensure_index()
+        return [self._correct_token(token, threshold) for token in tokens]
+    
+    def match_span(self, tokens: List[str], i: int) -> Tuple[int, List[str], bool]:
+        """Item yang disebut mulai token ke-i: (panjang span, id item, cocok frasa penuh?)
+        
+        Frasa terpanjang dicoba dulu (mis. "es kopi susu" sebelum "kopi"); jika tidak ada,
+        token yang merupakan bagian dari nama item dihitung sebagai partial match.
+        """
+        self._ensure_index()
+        for n in range(min(self._max_phrase_len, len(tokens) - i), 0, -1):
+            ids = self._phrase_index.get(tuple(tokens[i:i + n]))
+            if ids:
+                return n, ids, True
+        if len(tokens[i]) >= 3:
+            ids = self._token_index.get(tokens[i])
+            if ids:
+                return 1, sorted(ids), False
+        return 0, [], False
+    
+    def match_items(self, text: str, fuzzy_threshold: Optional[float] = None) -> List[MenuItem]:
+        """Mencari item yang disebut dalam teks, urut sesuai posisi sebutan
+
+        Jika fuzzy_threshold diisi, token yang tidak dikenal dikoreksi ke token nama
+        termirip bila skornya mencapai ambang tersebut.
+        """
+        tokens = tokenize(text)
+        if fuzzy_threshold is not None:
+            tokens = self.correct_tokens(tokens, fuzzy_threshold)
+        found: Dict[str, MenuItem] = {}
+        i = 0
+        while i < len(tokens):
+            size, ids, _ = self.match_span(tokens, i)
+            for item_id in ids:
+                if item_id not in found:
+                    found[item_id] = self.menu[item_id]
+            i += size or 1
+        return list(found.values())
 
     def get_menu_by_category(self, category: str) -> List[MenuItem]:
         return [item for item in self.menu.values() if item.category == category and item.available]
@@ -86,80 +840,1351 @@ class MenuManager:
         return [item for item in self.menu.values() if item.available]
     
     def search_menu(self, query: str) -> List[MenuItem]:
-        query = query.lower()
-        results = []
-        for item in self.menu.values():
-            if query in item.name.lower() or query in item.description.lower():
-                results.append(item)
-        return results
+        self._ensure_index()
+        result_ids: Optional[Set[str]] = None
+        for token in tokenize(query):
+            ids = self._token_index.get(token, set()) | self._desc_index.get(token, set())
+            result_ids = ids if result_ids is None else result_ids & ids
+            if not result_ids:
+                return []
+        if not result_ids:
+            return []
+        return sorted((self.menu[item_id] for item_id in result_ids), key=lambda item: item.name)
     
     def get_item_by_id(self, item_id: str) -> Optional[MenuItem]:
         return self.menu.get(item_id)
+    
+    def render_category(self, category: str) -> str:
+        """Blok teks satu kategori menu (di-cache sampai katalog berubah)"""
+        text = self._render_cache.get(category)
+        if text is None:
+            parts = [f"{CATEGORY_NAMES.get(category, category.upper())}\n", "-" * 25 + "\n"]
+            for item in self.get_menu_by_category(category):
+                parts.append(f"• {item.name} - Rp {item.price:,.0f}\n")
+                parts.append(f"  {item.description}\n\n")
+            parts.append("\n")
+            text = self._render_cache[category] = "".join(parts)
+        return text
+    
+    def render_menu(self, category: Optional[str] = None) -> str:
+        """Teks menu lengkap, atau satu kategori saja (di-cache sampai katalog berubah)"""
+        key = None if category is None else f"menu:{category}"
+        text = self._render_cache.get(key)
+        if text is None:
+            text = self._render_cache[key] = "".join(self.iter_menu(category))
+        return text
+    
+    def iter_menu(self, category: Optional[str] = None) -> Iterator[str]:
+        """Teks menu per potongan: judul, satu blok per kategori, lalu tips
+
+        Jika teks lengkap sudah ada di cache, dikirim sebagai satu potongan.
+        """
+        text = self._render_cache.get(None if category is None else f"menu:{category}")
+        if text is not None:
+            yield text
+            return
+        yield "📜 MENU KAFE DIGITAL 📜\n" + "=" * 40 + "\n\n"
+        if category is None:
+            categories = dict.fromkeys(item.category for item in self.get_all_menu())
+        else:
+            categories = [category]
+        for c in categories:
+            yield self.render_category(c)
+        yield "💡 Tips: Sebutkan nama minuman/makanan yang Anda inginkan!\nContoh: 'Saya mau 2 cappuccino dan 1 sandwich'"
+
+def load_menu_manager(catalog_path: Optional[str] = None, outlet: Optional[str] = None,
+                      snapshot_path: Optional[str] = None) -> MenuManager:
+    """MenuManager dari file katalog (.json/.csv dikompilasi ke .kcat bila perlu), atau menu bawaan
+
+    Jika snapshot_path diisi, MenuManager beserta index dimuat dari snapshot yang masih
+    cocok; bila belum ada atau sudah basi, dibangun seperti biasa lalu snapshot ditulis ulang.
+    """
+    if snapshot_path:
+        menu_manager = load_snapshot(snapshot_path, catalog_path, outlet)
+        if menu_manager is not None:
+            return menu_manager
+    if not catalog_path:
+        menu_manager = MenuManager()
+    else:
+        binary_path = catalog_path
+        if catalog_path.lower().endswith((".json", ".csv")):
+            binary_path = os.path.splitext(catalog_path)[0] + ".kcat"
+            if not os.path.exists(binary_path) or os.path.getmtime(binary_path) < os.path.getmtime(catalog_path):
+                build_catalog(catalog_path, binary_path)
+        menu_manager = MenuManager(CatalogFile(binary_path, outlet))
+    if snapshot_path:
+        save_snapshot(menu_manager, snapshot_path, catalog_path, outlet)
+    return menu_manager
+
+# Snapshot: header (magic, versi, panjang metadata) + metadata JSON + pickle MenuManager
+SNAPSHOT_MAGIC = b"KAFESNAP"
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct("<8sHI")
+
+def _snapshot_fingerprint(catalog_path: Optional[str], outlet: Optional[str]) -> Dict[str, Any]:
+    """Identitas sumber snapshot: berubahnya kode, katalog, atau versi Python membuatnya basi"""
+    files = [os.path.abspath(__file__)]
+    if catalog_path:
+        files.append(os.path.abspath(catalog_path))
+        binary_path = os.path.splitext(catalog_path)[0] + ".kcat"
+        if binary_path != catalog_path and os.path.exists(binary_path):
+            files.append(os.path.abspath(binary_path))
+    stats = []
+    for path in files:
+        stat = os.stat(path)
+        stats.append([path, stat.st_size, stat.st_mtime_ns])
+    return {"version": SNAPSHOT_VERSION, "python": list(sys.version_info[:2]),
+            "outlet": outlet or "", "files": stats}
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    """Memetakan kelas dari modul saat snapshot dibuat (mis. __main__) ke modul ini"""
+    def __init__(self, file, module: str):
+        super().__init__(file)
+        self._module = module
+    
+    def find_class(self, module: str, name: str):
+        if module == self._module:
+            return globals()[name]
+        return super().find_class(module, name)
+
+def save_snapshot(menu_manager: MenuManager, path: str, catalog_path: Optional[str] = None,
+                  outlet: Optional[str] = None):
+    """Menulis snapshot MenuManager (katalog + index) untuk start-up cepat"""
+    menu_manager._ensure_index()
+    metadata = json.dumps({"module": __name__, "fingerprint": _snapshot_fingerprint(catalog_path, outlet)}).encode("utf-8")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(metadata)))
+        f.write(metadata)
+        pickle.dump(menu_manager, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def load_snapshot(path: str, catalog_path: Optional[str] = None, outlet: Optional[str] = None) -> Optional[MenuManager]:
+    """Memuat snapshot jika ada dan masih cocok dengan sumbernya; None jika tidak
+
+    Snapshot berisi pickle, jadi hanya muat file yang dibuat sendiri oleh save_snapshot.
+    """
+    try:
+        with open(path, "rb") as f:
+            magic, version, metadata_length = _SNAPSHOT_HEADER.unpack(f.read(_SNAPSHOT_HEADER.size))
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                return None
+            metadata = json.loads(f.read(metadata_length))
+            if metadata["fingerprint"] != _snapshot_fingerprint(catalog_path, outlet):
+                return None
+            return _SnapshotUnpickler(f, metadata["module"]).load()
+    except (OSError, EOFError, struct.error, ValueError, KeyError, pickle.UnpicklingError):
+        return None
+
+@dataclass(frozen=True, slots=True)
+class ParsedLine:
+    """Satu item hasil parsing pesan"""
+    item_id: str
+    quantity: int
+    modifiers: Tuple[str, ...]
+
+@dataclass(frozen=True, slots=True)
+class ParsedMessage:
+    """Hasil parsing terstruktur satu pesan (tanpa teks balasan)"""
+    intents: Tuple[str, ...]
+    lines: Tuple[ParsedLine, ...]
+    categories: Tuple[str, ...] = ()
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "intents": list(self.intents),
+            "items": [{"id": line.item_id, "quantity": line.quantity, "modifiers": list(line.modifiers)}
+                      for line in self.lines],
+            "categories": list(self.categories),
+        }
+
+def normalize_utterance(text: str) -> str:
+    """Bentuk baku pesan untuk kunci cache: lowercase, tanpa tanda baca, spasi tunggal"""
+    return " ".join(tokenize(text))
+
+class ParseCache:
+    """Cache LRU hasil parse_message per teks ternormalisasi, terikat versi katalog"""
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Tuple[int, ParsedMessage]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: str, version: int) -> Optional[ParsedMessage]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def put(self, key: str, version: int, parsed: ParsedMessage):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (version, parsed)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+def _nearest_mentions(mentions: List[Tuple], spans: List[Tuple], prefer_previous: bool) -> Iterator[Tuple[int, int, Tuple]]:
+    """Memasangkan setiap span (urut posisi) ke sebutan item terdekat: (indeks sebutan, jarak, span)"""
+    if not mentions:
+        return
+    following = 0
+    for span in spans:
+        start, end = span[0], span[1]
+        while following < len(mentions) and mentions[following][0] < end:
+            following += 1
+        previous = following - 1
+        before = start - mentions[previous][1] if previous >= 0 else None
+        after = mentions[following][0] - end if following < len(mentions) else None
+        if after is None or (before is not None and (before < after or (before == after and prefer_previous))):
+            yield previous, before, span
+        else:
+            yield following, after, span
+
+def parse_message(menu_manager: MenuManager, user_input: str) -> ParsedMessage:
+    """Mengurai pesan menjadi intent, item, jumlah, dan modifier (hasil di-cache per teks ternormalisasi)"""
+    text = normalize_utterance(user_input)
+    version = menu_manager.version
+    parsed = menu_manager.parse_cache.get(text, version)
+    if parsed is not None:
+        return parsed
+    
+    tokens = menu_manager.correct_tokens(text.split(), FUZZY_ACCEPT_THRESHOLD)
+    intent, mentions, quantities, modifiers = _scan_tokens(menu_manager, tokens)
+    lines = _bind_mentions(mentions, quantities, modifiers)
+    parsed = ParsedMessage(tuple(sorted(intent.intents)), tuple(lines), tuple(intent.categories))
+    menu_manager.parse_cache.put(text, version, parsed)
+    return parsed
+
+def _scan_tokens(menu_manager: MenuManager, tokens: List[str]) -> Tuple[IntentResult, List[Tuple], List[Tuple], List[Tuple]]:
+    """Fase pencocokan: intent/kategori, plus sebutan item, jumlah, dan modifier beserta posisinya"""
+    # Satu kali jalan kiri ke kanan: setiap posisi menjadi sebutan item, kata kunci, atau jumlah.
+    # Sebutan item lengkap menang atas kata kunci yang lebih pendek, sehingga "es" di
+    # "es kopi susu" tidak dibaca sebagai modifier; kata kunci menang atas partial match.
+    intent = IntentResult()
+    mentions: List[Tuple[int, int, List[str]]] = []        # (awal, akhir, id item)
+    exact_mentions: List[bool] = []                        # sejajar mentions: cocok frasa penuh?
+    quantities: List[Tuple[int, int, int]] = []            # (awal, akhir, jumlah)
+    modifiers: List[Tuple[int, int, str, str, int]] = []   # (awal, akhir, grup, nilai, prioritas)
+    i = 0
+    while i < len(tokens):
+        item_size, item_ids, exact = menu_manager.match_span(tokens, i)
+        keyword_size, entries = INTENT_MATCHER.match_span(tokens, i)
+        if item_ids and (not keyword_size or (exact and item_size >= keyword_size)):
+            previous = mentions[-1] if mentions and mentions[-1][1] == i else None
+            if previous is not None and (set(item_ids) <= set(previous[2]) or set(previous[2]) <= set(item_ids)):
+                # Sebutan yang menempel dan hanya mengulang item sebelumnya ("cake coklat") adalah
+                # satu sebutan; span diperluas dan id yang lebih spesifik dipakai
+                ids = item_ids if len(item_ids) < len(previous[2]) else previous[2]
+                mentions[-1] = (previous[0], i + item_size, ids)
+                exact_mentions[-1] = exact_mentions[-1] or exact
+            else:
+                mentions.append((i, i + item_size, item_ids))
+                exact_mentions.append(exact)
+            i += item_size
+            continue
+        if keyword_size:
+            for kind, key, value, rank in entries:
+                if kind == "intent":
+                    intent.intents.add(key)
+                elif kind == "modifier":
+                    modifiers.append((i, i + keyword_size, key, value, rank))
+                elif key not in intent.categories:
+                    intent.categories.append(key)
+            i += keyword_size
+            continue
+        size, quantity = read_quantity(tokens, i)
+        if size:
+            quantities.append((i, i + size, quantity))
+        i += size or 1
+    return intent, _drop_vague_mentions(mentions, exact_mentions), quantities, modifiers
+
+def _drop_vague_mentions(mentions: List[Tuple], exact_mentions: List[bool]) -> List[Tuple]:
+    """Membuang partial match ambigu (beberapa item) yang menempel pada sebutan item lain
+
+    Di "2 latte susu oat", "susu" hanya kata deskriptif untuk latte; jika dihitung sebagai
+    sebutan, kata itu merebut modifier dan jumlah dari item yang sebenarnya dipesan.
+    """
+    def vague(k: int) -> bool:
+        return not exact_mentions[k] and len(mentions[k][2]) > 1
+    
+    kept = []
+    for k, mention in enumerate(mentions):
+        if vague(k):
+            # Jarak <= 1 token dari sebutan yang jelas dianggap masih bagian dari sebutan itu
+            before = k > 0 and not vague(k - 1) and mention[0] - mentions[k - 1][1] <= 1
+            after = k + 1 < len(mentions) and not vague(k + 1) and mentions[k + 1][0] - mention[1] <= 1
+            if before or after:
+                continue
+        kept.append(mention)
+    return kept
+
+def _bind_mentions(mentions: List[Tuple], quantities: List[Tuple], modifiers: List[Tuple]) -> List[ParsedLine]:
+    """Fase pengikatan: jumlah dan modifier ke sebutan item terdekat, menjadi baris pesanan"""
+    # Jumlah menempel ke sebutan item terdekat. Jika jaraknya sama, ikuti gaya kalimat:
+    # "2 latte 1 croissant" (jumlah di depan) atau "latte 2 croissant 1" (jumlah di belakang)
+    postfix = bool(mentions and quantities) and quantities[0][0] > mentions[0][0]
+    bound_quantity: Dict[int, Tuple[int, int]] = {}        # indeks sebutan -> (jarak, jumlah)
+    for index, distance, (_, _, quantity) in _nearest_mentions(mentions, quantities, prefer_previous=postfix):
+        if index not in bound_quantity or distance < bound_quantity[index][0]:
+            bound_quantity[index] = (distance, quantity)
+    # Modifier biasanya ditulis setelah item ("latte oat besar"), jadi seri jatuh ke item sebelumnya
+    bound_modifiers: List[Dict[str, Tuple[int, str]]] = [{} for _ in mentions]
+    for index, _, (_, _, group, value, rank) in _nearest_mentions(mentions, modifiers, prefer_previous=True):
+        chosen = bound_modifiers[index]
+        if rank < chosen.get(group, (len(MODIFIER_KEYWORDS[group]), ""))[0]:
+            chosen[group] = (rank, value)
+    
+    lines = []
+    for index, (_, _, item_ids) in enumerate(mentions):
+        quantity = bound_quantity[index][1] if index in bound_quantity else 1
+        chosen = IntentResult(modifiers={group: value for group, (_, value) in bound_modifiers[index].items()})
+        line_modifiers = tuple(chosen.modifier_list())
+        for item_id in item_ids:
+            lines.append(ParsedLine(item_id, quantity, line_modifiers))
+    return lines
+
+# MenuManager milik proses worker parse_batch
+_batch_menu_manager: Optional[MenuManager] = None
+
+def _init_batch_worker(menu_manager: Optional[MenuManager], catalog_path: Optional[str], outlet: Optional[str]):
+    global _batch_menu_manager
+    _batch_menu_manager = menu_manager if menu_manager is not None else load_menu_manager(catalog_path, outlet)
+
+def _parse_shard(messages: List[Tuple[str, str]]) -> List[Tuple[str, ParsedMessage]]:
+    return [(session_id, parse_message(_batch_menu_manager, text)) for session_id, text in messages]
+
+def parse_batch(messages: Iterable[Tuple[str, str]], menu_manager: Optional[MenuManager] = None, workers: int = 0,
+                chunk_size: int = 2000, catalog_path: Optional[str] = None,
+                outlet: Optional[str] = None) -> Iterator[Tuple[str, ParsedMessage]]:
+    """Parse massal (session_id, teks) menjadi ParsedMessage tanpa membuat teks balasan
+
+    Dengan workers > 1 pesan dibagi per sesi ke process pool: sesi yang sama selalu
+    masuk shard yang sama sehingga urutan hasil per sesi tetap sesuai input.
+    Jika menu_manager tidak diisi, worker memuat katalog dari catalog_path (atau menu bawaan).
+    """
+    if workers <= 1:
+        if menu_manager is None:
+            menu_manager = load_menu_manager(catalog_path, outlet)
+        for session_id, text in messages:
+            yield session_id, parse_message(menu_manager, text)
+        return
+    
+    def chunks() -> Iterator[List[List[Tuple[str, str]]]]:
+        shards: List[List[Tuple[str, str]]] = [[] for _ in range(workers)]
+        count = 0
+        for session_id, text in messages:
+            shards[zlib.crc32(session_id.encode("utf-8")) % workers].append((session_id, text))
+            count += 1
+            if count >= chunk_size:
+                yield shards
+                shards = [[] for _ in range(workers)]
+                count = 0
+        if count:
+            yield shards
+    
+    from concurrent.futures import ProcessPoolExecutor
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                             initargs=(menu_manager, catalog_path, outlet)) as pool:
+        in_flight: "deque[List[Any]]" = deque()
+        for shards in chunks():
+            in_flight.append([pool.submit(_parse_shard, shard) for shard in shards if shard])
+            # Batasi chunk yang sedang diproses agar memori tetap terkendali
+            while len(in_flight) > workers * 2:
+                for future in in_flight.popleft():
+                    yield from future.result()
+        while in_flight:
+            for future in in_flight.popleft():
+                yield from future.result()
+
+def parse_file(input_path: str, output_path: str, workers: int = os.cpu_count() or 1) -> int:
+    """Parse transkrip (JSON per baris {"session_id", "text"} atau "session_id<TAB>teks") ke file JSON per baris"""
+    def read_messages() -> Iterator[Tuple[str, str]]:
+        with open(input_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if not line.strip():
+                    continue
+                if line.lstrip().startswith("{"):
+                    record = json.loads(line)
+                    yield str(record["session_id"]), str(record.get("text", record.get("message", "")))
+                else:
+                    session_id, _, text = line.partition("\t")
+                    yield session_id, text
+    
+    count = 0
+    with open(output_path, "w", encoding="utf-8") as out:
+        for session_id, parsed in parse_batch(read_messages(), workers=workers, catalog_path=CATALOG_PATH or None,
+                                              outlet=CATALOG_OUTLET):
+            record = {"session_id": session_id, **parsed.to_dict()}
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+class OrderIdAllocator:
+    """Penghasil nomor pesanan yang aman dipakai bersama oleh banyak sesi"""
+    def __init__(self, start: int = 1000):
+        self._lock = threading.Lock()
+        self._last = start
+    
+    @property
+    def last(self) -> int:
+        return self._last
+    
+    def next_id(self) -> int:
+        with self._lock:
+            self._last += 1
+            return self._last
+
+class SharedOrderIdAllocator(OrderIdAllocator):
+    """Penghasil nomor pesanan lintas proses: counter di shared memory yang disewa per blok
+
+    Setiap proses mengambil block_size nomor sekaligus, jadi lock antar proses hanya
+    disentuh sekali per blok. Nomor unik di semua proses dan naik di dalam satu proses;
+    block_size=1 membuatnya naik secara global.
+    """
+    def __init__(self, start: int = 1000, block_size: int = 16, context=None):
+        super().__init__(start)
+        self.block_size = block_size
+        self._counter = (context or multiprocessing.get_context()).Value("q", start)
+        self._block_end = start
+    
+    def __getstate__(self) -> Dict[str, Any]:
+        # Lock thread dan sisa blok tidak ikut ke proses lain
+        return {"block_size": self.block_size, "counter": self._counter}
+    
+    def __setstate__(self, state: Dict[str, Any]):
+        self.block_size = state["block_size"]
+        self._counter = state["counter"]
+        self._lock = threading.Lock()
+        self._last = self._block_end = self._counter.value
+    
+    def next_id(self) -> int:
+        with self._lock:
+            if self._last >= self._block_end:
+                with self._counter.get_lock():
+                    base = self._counter.value
+                    self._counter.value = base + self.block_size
+                self._last, self._block_end = base, base + self.block_size
+            self._last += 1
+            return self._last
+
+class OrderSink(ABC):
+    """Tujuan penyimpanan pesanan yang sudah ditempatkan (pluggable)"""
+    @abstractmethod
+    def append(self, record: Dict[str, Any]) -> Any:
+        """Menambah record; nilai kembalian diteruskan ke wait()"""
+    
+    def wait(self, seq: Any, timeout: Optional[float] = None) -> bool:
+        """Menunggu sampai record dari append() tersimpan permanen"""
+        return True
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        self.flush()
+    
+    def last_order_number(self) -> Optional[int]:
+        """Nomor pesanan terakhir yang tersimpan, untuk melanjutkan order_counter"""
+        return None
+
+class JsonlOrderLog(OrderSink):
+    """Log pesanan append-only (JSON per baris) dengan group commit
+
+    Pesanan dikumpulkan di buffer lalu ditulis dan di-fsync bersama oleh thread
+    writer setiap flush_interval detik atau saat buffer mencapai batch_size. Pemanggil
+    wait() ikut jendela yang sama, jadi pesanan yang ditempatkan bersamaan berbagi satu
+    fsync; record yang masuk selama fsync berjalan ikut batch berikutnya.
+    """
+    TAIL_BLOCK = 64 * 1024
+    
+    def __init__(self, path: str = "orders.jsonl", flush_interval: float = 0.05, batch_size: int = 512,
+                 max_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self._cond = threading.Condition()
+        self._file_lock = threading.Lock()
+        self._buffer: List[bytes] = []
+        self._appended = 0
+        self._committed = 0
+        self._flush_requested = False
+        self._closed = False
+        self._error: Optional[BaseException] = None  # Kegagalan tulis/fsync terakhir; log berhenti menerima
+        self._last_number = self.read_last_number(path, batch_size)
+        self._truncate_partial_tail(path)
+        self._file = open(path, "ab")
+        self._writer = threading.Thread(target=self._writer_loop, name="kafe-order-log", daemon=True)
+        self._writer.start()
+    
+    def last_order_number(self) -> Optional[int]:
+        return self._last_number
+    
+    @classmethod
+    def _truncate_partial_tail(cls, path: str):
+        # Tulisan terakhir yang terpotong crash belum pernah dikonfirmasi; tanpa dibuang,
+        # record berikutnya tersambung ke baris itu dan ikut rusak
+        if not os.path.exists(path):
+            return
+        with open(path, "r+b") as f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(0, position - cls.TAIL_BLOCK)
+                f.seek(start)
+                newline = f.read(position - start).rfind(b"\n")
+                if newline >= 0:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position < end:
+                f.truncate(position)
+    
+    def append(self, record: Dict[str, Any]) -> int:
+        """Menambah record ke buffer; mengembalikan nomor urut untuk wait()"""
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Log pesanan sudah ditutup")
+            if self._error is not None:
+                raise RuntimeError("Log pesanan gagal ditulis") from self._error
+            self._buffer.append(line)
+            self._appended += 1
+            number = record.get("order_number")
+            if isinstance(number, int) and (self._last_number is None or number > self._last_number):
+                self._last_number = number
+            # Bangunkan writer untuk record pertama (memulai jendela group commit) dan saat batch penuh
+            if len(self._buffer) == 1 or len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+            return self._appended
+    
+    def wait(self, seq: int, timeout: Optional[float] = None) -> bool:
+        """Menunggu sampai record dengan nomor urut seq sudah di-fsync
+
+        Jika writer gagal sebelum record itu tersimpan, errornya dilempar ulang di sini.
+        """
+        with self._cond:
+            done = self._cond.wait_for(lambda: self._committed >= seq or self._error is not None, timeout)
+            if self._committed < seq and self._error is not None:
+                raise RuntimeError("Log pesanan gagal ditulis") from self._error
+            return done
+    
+    def flush(self):
+        with self._cond:
+            seq = self._appended
+            self._flush_requested = True
+            self._cond.notify_all()
+        self.wait(seq)
+    
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+        with self._file_lock:
+            self._file.close()
+    
+    def _writer_loop(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    self._cond.wait()
+                if not self._buffer:
+                    return
+                # Tunggu record lain sampai interval habis atau batch penuh (group commit)
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._buffer) < self.batch_size and not self._flush_requested and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._buffer = self._buffer, []
+                seq = self._appended
+                self._flush_requested = False
+            try:
+                with self._file_lock:
+                    self._file.write(b"".join(batch))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    if self.max_bytes and self._file.tell() >= self.max_bytes:
+                        self._rotate_locked()
+            except Exception as e:
+                # Record yang belum di-fsync tidak dianggap tersimpan; semua penunggu diberi tahu
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._committed = seq
+                self._cond.notify_all()
+    
+    def _segments(self) -> List[str]:
+        return self._segment_paths(self.path)
+    
+    @staticmethod
+    def _segment_paths(path: str) -> List[str]:
+        """Segmen hasil rotasi, dari yang terbaru"""
+        directory = os.path.dirname(os.path.abspath(path))
+        prefix = os.path.basename(path) + "."
+        numbers = []
+        for name in os.listdir(directory):
+            suffix = name[len(prefix):]
+            if name.startswith(prefix) and suffix.isdigit():
+                numbers.append(int(suffix))
+        return [f"{path}.{n}" for n in sorted(numbers, reverse=True)]
+    
+    def rotate(self):
+        """Menutup segmen aktif dan memulai file baru berisi checkpoint nomor pesanan"""
+        self.flush()
+        with self._file_lock:
+            self._rotate_locked()
+    
+    def _rotate_locked(self):
+        segments = self._segments()
+        next_segment = int(segments[0].rsplit(".", 1)[1]) + 1 if segments else 1
+        self._file.close()
+        os.replace(self.path, f"{self.path}.{next_segment}")
+        self._file = open(self.path, "ab")
+        checkpoint = {"type": "checkpoint", "order_number": self._last_number}
+        self._file.write((json.dumps(checkpoint) + "\n").encode("utf-8"))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+    
+    def compact(self, keep_segments: int) -> int:
+        """Menghapus segmen lama, menyisakan keep_segments terbaru; mengembalikan jumlah yang dihapus
+
+        Segmen berisi riwayat pesanan (juga sumber OrderAnalytics.from_log), jadi retensi wajib eksplisit.
+        """
+        if keep_segments < 0:
+            raise ValueError("keep_segments tidak boleh negatif")
+        old_segments = self._segments()[keep_segments:]
+        for segment in old_segments:
+            os.remove(segment)
+        return len(old_segments)
+    
+    @classmethod
+    def read_last_number(cls, path: str, window: int = 512) -> Optional[int]:
+        """Nomor pesanan tertinggi di log tanpa membukanya untuk ditulis
+
+        Nomor dialokasikan sebelum record masuk log, jadi pesanan yang ditempatkan bersamaan
+        bisa tertulis tidak urut; yang diambil adalah maksimum dari window record terakhir.
+        """
+        # Cukup baca ekor file (bukan replay seluruh log); jika kosong, cek segmen terakhir
+        for candidate in [path] + cls._segment_paths(path):
+            if os.path.exists(candidate):
+                number = cls._read_tail_number(candidate, window)
+                if number is not None:
+                    return number
+        return None
+    
+    @classmethod
+    def _read_tail_number(cls, path: str, window: int) -> Optional[int]:
+        with open(path, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            block = cls.TAIL_BLOCK
+            while True:
+                start = max(0, size - block)
+                f.seek(start)
+                lines = f.read(size - start).split(b"\n")
+                if start > 0:
+                    lines = lines[1:]  # Baris pertama mungkin terpotong
+                numbers = []
+                for line in reversed(lines):
+                    try:
+                        number = json.loads(line).get("order_number")
+                    except ValueError:
+                        continue  # Baris kosong atau tulisan terakhir yang tidak lengkap
+                    if isinstance(number, int):
+                        numbers.append(number)
+                        if len(numbers) >= window:
+                            break
+                if len(numbers) >= window or start == 0:
+                    return max(numbers, default=None)
+                block *= 2
+
+class MultiOrderSink(OrderSink):
+    """Meneruskan setiap pesanan ke beberapa sink sekaligus (mis. log + analitik)"""
+    def __init__(self, sinks: Iterable[OrderSink]):
+        self.sinks = list(sinks)
+    
+    def append(self, record: Dict[str, Any]) -> List[Any]:
+        return [sink.append(record) for sink in self.sinks]
+    
+    def wait(self, seq: List[Any], timeout: Optional[float] = None) -> bool:
+        return all([sink.wait(sink_seq, timeout) for sink, sink_seq in zip(self.sinks, seq)])
+    
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+    
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+    
+    def last_order_number(self) -> Optional[int]:
+        numbers = [number for number in (sink.last_order_number() for sink in self.sinks) if number is not None]
+        return max(numbers) if numbers else None
+
+class OrderAnalytics(OrderSink):
+    """Analitik penjualan kolumnar (NumPy) atas pesanan yang sudah ditempatkan
+
+    Setiap baris pesanan disimpan di array kolom: indeks pesanan, kode item, jumlah,
+    harga (Rupiah bulat) dan kode kategori; nomor dan waktu disimpan per pesanan.
+    Semua query berupa group-by vektor (bincount/unique) tanpa loop per baris.
+    """
+    _LINE_COLUMNS = (("_line_order", "int32"), ("_line_item", "int32"), ("_line_quantity", "int32"),
+                     ("_line_price", "int32"), ("_line_category", "int16"))
+    _ORDER_COLUMNS = (("_order_number", "int64"), ("_order_time", "float64"))
+    # Sampai batas ini (jumlah item^2) pasangan dihitung dengan bincount, di atasnya dengan unique
+    PAIR_BINCOUNT_LIMIT = 1 << 22
+    EXPORT_COLUMNS = ("order_number", "placed_at", "item_id", "category", "quantity", "price", "revenue")
+    
+    def __init__(self, capacity: int = 1024):
+        if np is None:
+            raise ImportError("OrderAnalytics membutuhkan numpy (pip install numpy)")
+        self._lock = threading.Lock()
+        self._item_codes: Dict[str, int] = {}
+        self._item_ids: List[str] = []
+        self._category_codes: Dict[str, int] = {}
+        self._categories: List[str] = []
+        self._lines = 0
+        self._orders = 0
+        for name, dtype in self._LINE_COLUMNS + self._ORDER_COLUMNS:
+            setattr(self, name, np.empty(capacity, dtype))
+    
+    @property
+    def line_count(self) -> int:
+        return self._lines
+    
+    @property
+    def order_count(self) -> int:
+        return self._orders
+    
+    def append(self, record: Dict[str, Any]):
+        if "items" not in record:
+            return  # Checkpoint log, bukan pesanan
+        with self._lock:
+            batch = self._new_batch()
+            self._collect(record, batch)
+            self._append_columns(*batch)
+    
+    @classmethod
+    def from_log(cls, *paths: str, chunk_lines: int = 100_000) -> OrderAnalytics:
+        """Membangun analitik dari log pesanan JSONL (termasuk segmen hasil rotasi)"""
+        analytics = cls()
+        for path in paths:
+            for segment in list(reversed(JsonlOrderLog._segment_paths(path))) + [path]:
+                if not os.path.exists(segment):
+                    continue
+                with open(segment, "rb") as f, analytics._lock:
+                    batch = analytics._new_batch()
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue  # Tulisan terakhir yang tidak lengkap
+                        if "items" in record:
+                            analytics._collect(record, batch)
+                        if len(batch[3]) >= chunk_lines:
+                            analytics._append_columns(*batch)
+                            batch = analytics._new_batch()
+                    analytics._append_columns(*batch)
+        return analytics
+    
+    @staticmethod
+    def _new_batch() -> Tuple[List[Any], ...]:
+        # nomor, waktu (per pesanan); indeks pesanan, item, jumlah, harga, kategori (per baris)
+        return [], [], [], [], [], [], []
+    
+    @staticmethod
+    def _code(codes: Dict[str, int], values: List[str], value: str) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+    
+    def _collect(self, record: Dict[str, Any], batch: Tuple[List[Any], ...]):
+        numbers, times, line_order, items, quantities, prices, categories = batch
+        index = len(numbers)
+        numbers.append(record.get("order_number") or 0)
+        times.append(record.get("placed_at") or 0.0)
+        for item in record["items"]:
+            line_order.append(index)
+            items.append(self._code(self._item_codes, self._item_ids, item["id"]))
+            quantities.append(item["quantity"])
+            prices.append(int(item["price"]))
+            categories.append(self._code(self._category_codes, self._categories, item.get("category") or "lainnya"))
+    
+    def _append_columns(self, numbers, times, line_order, items, quantities, prices, categories):
+        """Menambah satu blok pesanan sekaligus; indeks pesanan relatif terhadap blok"""
+        lines, orders = len(items), len(numbers)
+        self._reserve(self._LINE_COLUMNS, self._lines + lines)
+        self._reserve(self._ORDER_COLUMNS, self._orders + orders)
+        start, stop = self._lines, self._lines + lines
+        self._line_order[start:stop] = np.asarray(line_order, dtype=np.int32) + self._orders
+        self._line_item[start:stop] = items
+        self._line_quantity[start:stop] = quantities
+        self._line_price[start:stop] = prices
+        self._line_category[start:stop] = categories
+        self._order_number[self._orders:self._orders + orders] = numbers
+        self._order_time[self._orders:self._orders + orders] = times
+        self._lines, self._orders = stop, self._orders + orders
+    
+    def _reserve(self, columns: Tuple[Tuple[str, str], ...], size: int):
+        # Kapasitas dilipatgandakan agar append tetap amortized O(1); array lama tetap
+        # utuh sehingga view yang sedang dipakai query tidak ikut berubah
+        used = self._lines if columns is self._LINE_COLUMNS else self._orders
+        capacity = len(getattr(self, columns[0][0]))
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2)
+        for name, dtype in columns:
+            grown = np.empty(capacity, dtype)
+            grown[:used] = getattr(self, name)[:used]
+            setattr(self, name, grown)
+    
+    def _snapshot(self, since: Optional[float] = None, until: Optional[float] = None) -> Dict[str, Any]:
+        """View kolom baris (difilter waktu pesanan) yang konsisten untuk satu query"""
+        with self._lock:
+            lines, orders = self._lines, self._orders
+            columns = {name[6:]: getattr(self, name)[:lines] for name, _ in self._LINE_COLUMNS}
+            columns["number"] = self._order_number[:orders]
+            columns["time"] = self._order_time[:orders]
+            columns["item_count"] = len(self._item_ids)
+            columns["category_count"] = len(self._categories)
+        if since is not None or until is not None:
+            selected = np.ones(orders, dtype=bool)
+            if since is not None:
+                selected &= columns["time"] >= since
+            if until is not None:
+                selected &= columns["time"] < until
+            mask = selected[columns["order"]]
+            for name, _ in self._LINE_COLUMNS:
+                columns[name[6:]] = columns[name[6:]][mask]
+        columns["revenue"] = columns["quantity"].astype(np.int64) * columns["price"]
+        return columns
+    
+    @staticmethod
+    def _top(totals, n: int) -> List[int]:
+        """Indeks n nilai terbesar (> 0), terurut menurun; argpartition, bukan sort penuh"""
+        if n < len(totals):
+            candidates = np.argpartition(-totals, n - 1)[:n] if n > 0 else np.empty(0, dtype=np.intp)
+        else:
+            candidates = np.arange(len(totals))
+        candidates = candidates[np.argsort(-totals[candidates], kind="stable")]
+        return [int(i) for i in candidates if totals[i] > 0]
+    
+    def total_revenue(self, since: Optional[float] = None, until: Optional[float] = None) -> int:
+        return int(self._snapshot(since, until)["revenue"].sum())
+    
+    def revenue_by_item(self, since: Optional[float] = None, until: Optional[float] = None) -> Dict[str, int]:
+        """Omzet per item, dari yang terbesar"""
+        columns = self._snapshot(since, until)
+        totals = np.bincount(columns["item"], weights=columns["revenue"], minlength=columns["item_count"])
+        return {self._item_ids[i]: int(totals[i]) for i in self._top(totals, len(totals))}
+    
+    def revenue_by_category(self, since: Optional[float] = None, until: Optional[float] = None) -> Dict[str, int]:
+        """Omzet per kategori, dari yang terbesar"""
+        columns = self._snapshot(since, until)
+        totals = np.bincount(columns["category"], weights=columns["revenue"], minlength=columns["category_count"])
+        return {self._categories[i]: int(totals[i]) for i in self._top(totals, len(totals))}
+    
+    def revenue_by_hour(self, utc_offset: Optional[float] = None, since: Optional[float] = None,
+                        until: Optional[float] = None) -> List[int]:
+        """Omzet per jam (0-23); utc_offset dalam jam, default zona waktu lokal"""
+        if utc_offset is None:
+            utc_offset = time.localtime().tm_gmtoff / 3600
+        columns = self._snapshot(since, until)
+        # Aritmetika integer pada detik jauh lebih cepat daripada floor division float
+        seconds = columns["time"].astype(np.int64) + int(utc_offset * 3600)
+        hours = (seconds // 3600 % 24).astype(np.int8)
+        totals = np.bincount(hours[columns["order"]], weights=columns["revenue"], minlength=24)
+        return [int(total) for total in totals]
+    
+    def top_items(self, n: int = 10, by: str = "revenue", since: Optional[float] = None,
+                  until: Optional[float] = None) -> List[Tuple[str, int]]:
+        """n item teratas menurut omzet (by="revenue") atau jumlah porsi (by="quantity")"""
+        if by not in ("revenue", "quantity"):
+            raise ValueError(f"by harus 'revenue' atau 'quantity', bukan {by!r}")
+        columns = self._snapshot(since, until)
+        totals = np.bincount(columns["item"], weights=columns[by], minlength=columns["item_count"])
+        return [(self._item_ids[i], int(totals[i])) for i in self._top(totals, n)]
+    
+    def co_occurrence(self, item_id: Optional[str] = None, top: int = 10, since: Optional[float] = None,
+                      until: Optional[float] = None) -> List[Tuple[Any, ...]]:
+        """Pasangan item yang paling sering ada di pesanan yang sama
+
+        Tanpa item_id: [(item_a, item_b, jumlah_pesanan)]. Dengan item_id: item yang
+        paling sering dibeli bersamanya, [(item, jumlah_pesanan)].
+        """
+        columns = self._snapshot(since, until)
+        width = max(columns["item_count"], 1)
+        code = self._item_codes.get(item_id) if item_id is not None else None
+        if item_id is not None and code is None:
+            return []
+        # Baris satu pesanan selalu bersebelahan (satu blok per append), jadi pasangan
+        # ke-d dalam keranjang didapat dengan membandingkan baris d langkah di depan;
+        # jumlah putaran = isi keranjang terbesar, bukan jumlah baris, dan tanpa sort
+        orders, items = columns["order"], columns["item"]
+        # Item yang sama di dua baris (modifier berbeda) hanya dihitung sekali per pesanan
+        duplicate = np.zeros(len(items), dtype=bool)
+        max_basket = 1
+        while max_basket < len(items):
+            same = orders[max_basket:] == orders[:-max_basket]
+            if not same.any():
+                break
+            duplicate[max_basket:] |= same & (items[max_basket:] == items[:-max_basket])
+            max_basket += 1
+        if duplicate.any():
+            orders, items = orders[~duplicate], items[~duplicate]
+        found = []
+        for offset in range(1, max_basket):
+            same = orders[offset:] == orders[:-offset]
+            first, second = items[:-offset][same], items[offset:][same]
+            if code is not None:
+                found.append(np.concatenate([second[first == code], first[second == code]]))
+            else:
+                found.append(np.minimum(first, second).astype(np.int64) * width + np.maximum(first, second))
+        found = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+        if code is not None:
+            totals = np.bincount(found, minlength=width)
+            return [(self._item_ids[i], int(totals[i])) for i in self._top(totals, top)]
+        if width * width <= self.PAIR_BINCOUNT_LIMIT:
+            counts = np.bincount(found, minlength=width * width)
+            pairs = np.arange(len(counts))
+        else:
+            pairs, counts = np.unique(found, return_counts=True)
+        return [(self._item_ids[int(pairs[i]) // width], self._item_ids[int(pairs[i]) % width], int(counts[i]))
+                for i in self._top(counts, top)]
+    
+    def summary(self, top: int = 10, utc_offset: Optional[float] = None) -> Dict[str, Any]:
+        """Ringkasan penjualan dalam bentuk dict (siap JSON)"""
+        return {
+            "orders": self.order_count,
+            "lines": self.line_count,
+            "revenue": self.total_revenue(),
+            "top_items": self.top_items(top),
+            "by_category": self.revenue_by_category(),
+            "by_hour": self.revenue_by_hour(utc_offset),
+            "pairs": self.co_occurrence(top=top),
+        }
+    
+    def report(self, menu_manager: Optional[MenuManager] = None, top: int = 5, utc_offset: Optional[float] = None) -> str:
+        """Laporan penjualan singkat untuk ditampilkan ke pemilik kafe"""
+        def name(item_id: str) -> str:
+            item = menu_manager.get_item_by_id(item_id) if menu_manager is not None else None
+            return item.name if item is not None else item_id
+        
+        summary = self.summary(top, utc_offset)
+        lines = ["📊 LAPORAN PENJUALAN",
+                 f"Pesanan: {summary['orders']:,} | Baris: {summary['lines']:,} | Omzet: Rp {summary['revenue']:,.0f}"]
+        lines.append("\n🏆 Item terlaris:")
+        for rank, (item_id, revenue) in enumerate(summary["top_items"], 1):
+            lines.append(f"   {rank}. {name(item_id)} - Rp {revenue:,.0f}")
+        lines.append("\n📂 Per kategori:")
+        for category, revenue in summary["by_category"].items():
+            lines.append(f"   {CATEGORY_NAMES.get(category, category.upper())}: Rp {revenue:,.0f}")
+        lines.append("\n🕐 Per jam:")
+        for hour, revenue in enumerate(summary["by_hour"]):
+            if revenue:
+                lines.append(f"   {hour:02d}:00 - Rp {revenue:,.0f}")
+        if summary["pairs"]:
+            lines.append("\n🤝 Sering dibeli bersama:")
+            for first, second, count in summary["pairs"]:
+                lines.append(f"   {name(first)} + {name(second)} ({count:,} pesanan)")
+        return "\n".join(lines)
+    
+    @staticmethod
+    def _export_chunks(columns: Dict[str, Any], chunk_rows: int) -> Iterator[Tuple[Any, ...]]:
+        for start in range(0, len(columns["item"]), chunk_rows):
+            stop = start + chunk_rows
+            orders = columns["order"][start:stop]
+            yield (columns["number"][orders], columns["time"][orders], columns["item"][start:stop],
+                   columns["category"][start:stop], columns["quantity"][start:stop], columns["price"][start:stop],
+                   columns["revenue"][start:stop])
+    
+    def export_csv(self, path: str, chunk_rows: int = 100_000) -> int:
+        """Menulis semua baris pesanan ke CSV per potongan; mengembalikan jumlah baris"""
+        columns = self._snapshot()
+        item_ids = np.array(self._item_ids, dtype=object)
+        categories = np.array(self._categories, dtype=object)
+        rows = 0
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.EXPORT_COLUMNS)
+            for numbers, times, items, category, quantities, prices, revenue in self._export_chunks(columns, chunk_rows):
+                writer.writerows(zip(numbers.tolist(), times.tolist(), item_ids[items].tolist(),
+                                     categories[category].tolist(), quantities.tolist(), prices.tolist(),
+                                     revenue.tolist()))
+                rows += len(items)
+        return rows
+    
+    def export_parquet(self, path: str, chunk_rows: int = 1_000_000) -> int:
+        """Menulis semua baris pesanan ke Parquet, satu row group per potongan (butuh pyarrow)"""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Ekspor Parquet membutuhkan pyarrow (pip install pyarrow)") from e
+        
+        # Kode item/kategori dipakai langsung sebagai indeks kolom dictionary
+        columns = self._snapshot()
+        item_ids = pa.array(list(self._item_ids), type=pa.string())
+        categories = pa.array(list(self._categories), type=pa.string())
+        placed_at = pa.timestamp("ms", tz="UTC")
+        schema = pa.schema([("order_number", pa.int64()), ("placed_at", placed_at),
+                            ("item_id", pa.dictionary(pa.int32(), pa.string())),
+                            ("category", pa.dictionary(pa.int16(), pa.string())),
+                            ("quantity", pa.int32()), ("price", pa.int32()), ("revenue", pa.int64())])
+        rows = 0
+        with pq.ParquetWriter(path, schema) as writer:
+            for numbers, times, items, category, quantities, prices, revenue in self._export_chunks(columns, chunk_rows):
+                writer.write_table(pa.Table.from_arrays([
+                    pa.array(numbers), pa.array((times * 1000).astype(np.int64), type=placed_at),
+                    pa.DictionaryArray.from_arrays(items, item_ids),
+                    pa.DictionaryArray.from_arrays(category, categories),
+                    pa.array(quantities), pa.array(prices), pa.array(revenue)], schema=schema))
+                rows += len(items)
+        return rows
+
+@dataclass(frozen=True, slots=True)
+class StationConfig:
+    capacity: int  # Barista/alat yang bekerja paralel
+    default_prep: int  # Detik per porsi jika MenuItem.prep_time = 0
+    batch_size: int  # Porsi identik maksimal dalam satu batch
+    batch_extra: float  # Tambahan waktu per porsi ekstra dalam batch (fraksi prep time)
+
+KITCHEN_STATIONS = {
+    "espresso_bar": StationConfig(capacity=3, default_prep=120, batch_size=4, batch_extra=0.35),
+    "cold_drinks": StationConfig(capacity=2, default_prep=90, batch_size=6, batch_extra=0.25),
+    "food": StationConfig(capacity=3, default_prep=300, batch_size=2, batch_extra=0.6),
+}
+
+# Stasiun dapur per kategori menu; kategori lain masuk ke DEFAULT_STATION
+STATION_BY_CATEGORY = {"kopi": "espresso_bar", "teh": "espresso_bar", "dingin": "cold_drinks",
+                       "makanan": "food", "snack": "food"}
+DEFAULT_STATION = "food"
+
+@dataclass(slots=True)
+class KitchenTicket:
+    """Satu baris pesanan yang menunggu di stasiun; units berkurang saat sebagian masuk batch"""
+    order_id: str
+    key: Tuple[str, int, str]  # Item identik (id, modifier, catatan) boleh dibuat bersama
+    units: int
+    prep_time: int
+    enqueued_at: float
+    taken: bool = False
+
+@dataclass(slots=True)
+class KitchenBatch:
+    """Porsi identik yang dibuat sekaligus oleh satu slot stasiun (tiket besar bisa terbagi ke beberapa batch)"""
+    station: str
+    key: Tuple[str, int, str]
+    tickets: List[KitchenTicket]
+    units: int
+    start: float
+    end: float
+
+class StationQueue:
+    """Heap prioritas tiket satu stasiun, dengan index per item untuk mengumpulkan batch"""
+    def __init__(self, name: str, config: StationConfig):
+        self.name = name
+        self.config = config
+        self._heap: List[Tuple[int, int, KitchenTicket]] = []
+        self._by_key: Dict[Tuple[str, int, str], "deque[KitchenTicket]"] = {}
+        self._key_units: Dict[Tuple[str, int, str], int] = {}
+        self._seq = 0
+        self.pending_units = 0
+        self.pending_work = 0.0  # Detik kerja yang belum dimulai, sudah memperhitungkan batch
+        self.free_at = [0.0] * config.capacity  # Heap waktu slot kosong kembali
+    
+    def __len__(self) -> int:
+        return self.pending_units
+    
+    def work(self, prep_time: int, units: int) -> float:
+        """Detik untuk membuat units porsi identik dalam batch sebesar mungkin"""
+        batches = -(-units // self.config.batch_size)
+        return prep_time * (batches + self.config.batch_extra * (units - batches))
+    
+    def _add_units(self, key: Tuple[str, int, str], prep_time: int, units: int):
+        before = self._key_units.get(key, 0)
+        after = before + units
+        if after:
+            self._key_units[key] = after
+        else:
+            del self._key_units[key]
+        self.pending_units += units
+        self.pending_work += self.work(prep_time, after) - self.work(prep_time, before)
+    
+    def push(self, ticket: KitchenTicket, priority: int = 0):
+        self._seq += 1
+        heapq.heappush(self._heap, (priority, self._seq, ticket))
+        self._by_key.setdefault(ticket.key, deque()).append(ticket)
+        self._add_units(ticket.key, ticket.prep_time, ticket.units)
+    
+    def peek(self) -> Optional[KitchenTicket]:
+        # Tiket yang sudah ikut batch lain dibuang malas (lazy deletion)
+        while self._heap and self._heap[0][2].taken:
+            heapq.heappop(self._heap)
+        return self._heap[0][2] if self._heap else None
+    
+    def pop_batch(self, start: float) -> Optional[KitchenBatch]:
+        """Mengambil sampai batch_size porsi dari tiket teratas, dilengkapi tiket identik yang sudah masuk sebelum start"""
+        first = self.peek()
+        if first is None:
+            return None
+        batch_size = self.config.batch_size
+        parts = [(first, min(first.units, batch_size))]
+        units = parts[0][1]
+        bucket = self._by_key[first.key]
+        for ticket in bucket:
+            if units >= batch_size:
+                break
+            if ticket is first or ticket.taken:
+                continue
+            if ticket.enqueued_at > start:
+                break
+            parts.append((ticket, min(ticket.units, batch_size - units)))
+            units += parts[-1][1]
+        # Tiket yang porsinya habis selesai; sisanya tetap di heap dengan prioritas yang sama
+        for ticket, taken_units in parts:
+            ticket.units -= taken_units
+            ticket.taken = ticket.units == 0
+        tickets = [ticket for ticket, _ in parts]
+        if first.taken:
+            heapq.heappop(self._heap)
+        while bucket and bucket[0].taken:
+            bucket.popleft()
+        if not bucket:
+            del self._by_key[first.key]
+        self._add_units(first.key, first.prep_time, -units)
+        return KitchenBatch(self.name, first.key, tickets, units, start, start + self.work(first.prep_time, units))
+    
+    def eta(self, now: float, extra_work: float = 0.0) -> float:
+        """Detik sampai antrian saat ini (plus extra_work) selesai, dibagi rata ke semua slot"""
+        busy = sum(max(0.0, free_at - now) for free_at in self.free_at)
+        return (self.pending_work + extra_work + busy) / self.config.capacity
+
+class KitchenQueue:
+    """Antrian dapur per stasiun: heap prioritas, batch item identik lintas pesanan, dan ETA dari beban
+
+    Progres dapur dihitung dari prep time nominal: advance(now) memulai batch di slot yang
+    kosong sampai waktu now. Satu tiket per baris pesanan (berapa pun jumlahnya), jadi
+    enqueue/dequeue O(log n) terhadap jumlah baris yang menunggu.
+    """
+    def __init__(self, stations: Optional[Dict[str, StationConfig]] = None, clock=time.monotonic, on_start=None):
+        self.stations = {name: StationQueue(name, config) for name, config in (stations or KITCHEN_STATIONS).items()}
+        self.clock = clock
+        # Callback opsional on_start(batch) setiap kali sebuah batch mulai dikerjakan
+        self.on_start = on_start
+        self._lock = threading.Lock()
+    
+    def station_for(self, menu_item: MenuItem) -> StationQueue:
+        station = self.stations.get(STATION_BY_CATEGORY.get(menu_item.category, DEFAULT_STATION))
+        return station if station is not None else next(iter(self.stations.values()))
+    
+    def _tickets(self, order_id: str, items: Iterable[OrderItem], now: float) -> List[Tuple[StationQueue, KitchenTicket]]:
+        tickets = []
+        for item in items:
+            station = self.station_for(item.menu_item)
+            prep_time = item.menu_item.prep_time or station.config.default_prep
+            tickets.append((station, KitchenTicket(order_id, item.key, item.quantity, prep_time, now)))
+        return tickets
+    
+    @staticmethod
+    def _eta(demand: List[Tuple[StationQueue, int, int]], now: float, queued: bool) -> float:
+        # demand: (stasiun, prep time, porsi) per tiket, dicatat sebelum advance mengurangi porsinya.
+        # Pesanan selesai saat stasiun terlama selesai, minimal selama tiketnya sendiri yang terlama
+        work: Dict[str, float] = {}
+        longest: Dict[str, float] = {}
+        stations = {}
+        for station, prep_time, units in demand:
+            ticket_work = station.work(prep_time, units)
+            stations[station.name] = station
+            work[station.name] = work.get(station.name, 0.0) + ticket_work
+            longest[station.name] = max(longest.get(station.name, 0.0), ticket_work)
+        eta = 0.0
+        for name, station in stations.items():
+            eta = max(eta, station.eta(now, 0.0 if queued else work[name]), longest[name])
+        return eta
+    
+    def submit(self, order_id: str, items: Iterable[OrderItem], priority: int = 0,
+               now: Optional[float] = None) -> float:
+        """Memasukkan pesanan ke antrian; mengembalikan estimasi detik sampai pesanan siap"""
+        with self._lock:
+            now = self.clock() if now is None else now
+            self._advance(now)
+            tickets = self._tickets(order_id, items, now)
+            demand = [(station, ticket.prep_time, ticket.units) for station, ticket in tickets]
+            for station, ticket in tickets:
+                station.push(ticket, priority)
+            self._advance(now)  # Slot yang kosong langsung mulai mengerjakan
+            return self._eta(demand, now, queued=True)
+    
+    def estimate(self, items: Iterable[OrderItem], now: Optional[float] = None) -> float:
+        """ETA jika pesanan masuk sekarang, tanpa memasukkannya ke antrian"""
+        with self._lock:
+            now = self.clock() if now is None else now
+            self._advance(now)
+            demand = [(station, ticket.prep_time, ticket.units) for station, ticket in self._tickets("", items, now)]
+            return self._eta(demand, now, queued=False)
+    
+    def advance(self, now: Optional[float] = None) -> List[KitchenBatch]:
+        """Memulai batch di setiap slot yang kosong sampai waktu now; mengembalikan batch yang dimulai"""
+        with self._lock:
+            return self._advance(self.clock() if now is None else now)
+    
+    def _advance(self, now: float) -> List[KitchenBatch]:
+        started = []
+        for station in self.stations.values():
+            while True:
+                ticket = station.peek()
+                if ticket is None:
+                    break
+                start = max(station.free_at[0], ticket.enqueued_at)
+                if start > now:
+                    break
+                batch = station.pop_batch(start)
+                heapq.heapreplace(station.free_at, batch.end)
+                started.append(batch)
+                if self.on_start is not None:
+                    self.on_start(batch)
+        return started
+    
+    def depth(self) -> Dict[str, int]:
+        """Jumlah porsi yang belum dimulai per stasiun"""
+        return {name: len(station) for name, station in self.stations.items()}
+
+def format_eta(seconds: float) -> str:
+    """Estimasi detik menjadi rentang menit untuk pelanggan (mis. 6-8 menit)"""
+    minutes = max(1, -int(-seconds // 60))
+    return f"{minutes}-{minutes + max(2, minutes // 4)} menit"
 
 class OrderManager:
-    def __init__(self):
+    def __init__(self, id_allocator: Optional[OrderIdAllocator] = None, order_sink: Optional[OrderSink] = None,
+                 kitchen: Optional[KitchenQueue] = None):
         self.current_order = Order()
-        self.order_counter = 1000
+        self.order_sink = order_sink
+        # Antrian dapur untuk ETA; tanpa kitchen dipakai estimasi tetap
+        self.kitchen = kitchen
+        if id_allocator is None:
+            last_number = order_sink.last_order_number() if order_sink is not None else None
+            id_allocator = OrderIdAllocator(last_number if last_number is not None else 1000)
+        self.id_allocator = id_allocator
+    
+    @property
+    def order_counter(self) -> int:
+        return self.id_allocator.last
     
     def add_to_order(self, menu_item: MenuItem, quantity: int = 1, modifiers: List[str] = None, special_requests: str = ""):
         if modifiers is None:
             modifiers = []
+        if quantity <= 0:
+            return f"⚠️ Jumlah {menu_item.name} minimal 1 porsi"
+        
+        order = self.current_order
+        modifier_mask = encode_modifiers(modifiers)
+        key = line_key(menu_item.id, modifier_mask, special_requests)
         
         # Cek apakah item sudah ada di order
-        for existing_item in self.current_order.items:
-            if (existing_item.menu_item.id == menu_item.id and 
-                existing_item.modifiers == modifiers and 
-                existing_item.special_requests == special_requests):
-                existing_item.quantity += quantity
-                self._calculate_total()
-                return f"Ditambahkan {quantity} {menu_item.name} ke pesanan (total: {existing_item.quantity})"
+        existing_item = self._find_line(order, key)
+        if existing_item is not None:
+            quantity = min(quantity, MAX_QUANTITY - existing_item.quantity)
+            if quantity <= 0:
+                return f"⚠️ {menu_item.name} sudah {existing_item.quantity} porsi (maksimal {MAX_QUANTITY} per item)"
+            existing_item.quantity += quantity
+            order.total += menu_item.price * quantity
+            return f"Ditambahkan {quantity} {menu_item.name} ke pesanan (total: {existing_item.quantity})"
         
         # Tambah item baru
-        order_item = OrderItem(menu_item, quantity, modifiers, special_requests)
-        self.current_order.items.append(order_item)
-        self._calculate_total()
+        quantity = min(quantity, MAX_QUANTITY)
+        order_item = OrderItem(menu_item, quantity, modifier_mask, key[2])
+        order.items.append(order_item)
+        if order.lines is not None:
+            order.lines[key] = order_item
+        elif len(order.items) > LINE_INDEX_THRESHOLD:
+            order.lines = {item.key: item for item in order.items}
+        order.total += order_item.subtotal
         return f"Berhasil menambahkan {quantity} {menu_item.name} ke pesanan"
     
+    @staticmethod
+    def _find_line(order: Order, key: Tuple[str, int, str]) -> Optional[OrderItem]:
+        if order.lines is not None:
+            return order.lines.get(key)
+        item_id, modifier_mask, special_requests = key
+        for item in order.items:
+            if (item.menu_item.id == item_id and item.modifier_mask == modifier_mask and
+                    item.special_requests == special_requests):
+                return item
+        return None
+    
     def remove_from_order(self, item_index: int) -> str:
-        if 0 <= item_index < len(self.current_order.items):
-            removed_item = self.current_order.items.pop(item_index)
-            self._calculate_total()
+        order = self.current_order
+        if 0 <= item_index < len(order.items):
+            removed_item = order.items.pop(item_index)
+            if order.lines is not None:
+                del order.lines[removed_item.key]
+            order.total -= removed_item.subtotal
             return f"Berhasil menghapus {removed_item.menu_item.name} dari pesanan"
         return "Item tidak ditemukan dalam pesanan"
     
+    def set_quantity(self, item_index: int, quantity: int) -> str:
+        """Mengubah jumlah item; jumlah <= 0 menghapus item, di atas MAX_QUANTITY dipotong"""
+        order = self.current_order
+        if not 0 <= item_index < len(order.items):
+            return "Item tidak ditemukan dalam pesanan"
+        if quantity <= 0:
+            return self.remove_from_order(item_index)
+        quantity = min(quantity, MAX_QUANTITY)
+        item = order.items[item_index]
+        order.total += item.menu_item.price * (quantity - item.quantity)
+        item.quantity = quantity
+        return f"Jumlah {item.menu_item.name} diubah menjadi {quantity}"
+    
     def clear_order(self):
         self.current_order = Order()
         return "Pesanan telah dibersihkan"
     
     def get_order_summary(self) -> str:
-        if not self.current_order.items:
-            return "Pesanan masih kosong"
-        
-        summary = "📋 RINGKASAN PESANAN:\n"
-        summary += "=" * 30 + "\n"
-        
-        for i, item in enumerate(self.current_order.items, 1):
-            summary += f"{i}. {item.menu_item.name} x{item.quantity}\n"
-            summary += f"   Harga: Rp {item.menu_item.price:,.0f}\n"
-            
-            if item.modifiers:
-                summary += f"   Modifikasi: {', '.join(item.modifiers)}\n"
-            
-            if item.special_requests:
-                summary += f"   Catatan: {item.special_requests}\n"
-            
-            subtotal = item.menu_item.price * item.quantity
-            summary += f"   Subtotal: Rp {subtotal:,.0f}\n"
-            summary += "-" * 25 + "\n"
-        
-        summary += f"\n💰 TOTAL: Rp {self.current_order.total:,.0f}"
-        return summary
+        # Teks tiap baris diambil dari cache render_line, ringkasan cukup dirangkai
+        return "".join(self.iter_order_summary())
     
-    def _calculate_total(self):
-        total = 0
-        for item in self.current_order.items:
-            total += item.menu_item.price * item.quantity
-        self.current_order.total = total
+    def iter_order_summary(self) -> Iterator[str]:
+        """Ringkasan pesanan per potongan: judul, satu potongan per baris item, lalu total"""
+        order = self.current_order
+        if not order.items:
+            yield "Pesanan masih kosong"
+            return
+        yield "📋 RINGKASAN PESANAN:\n" + "=" * 30 + "\n"
+        for i, item in enumerate(order.items, 1):
+            yield f"{i}. {item.render()}"
+        yield f"\n💰 TOTAL: Rp {order.total:,.0f}"
     
     def confirm_order(self) -> Dict[str, Any]:
         if not self.current_order.items:
@@ -176,30 +2201,120 @@ class OrderManager:
         if not self.current_order.items:
             return {"success": False, "message": "Tidak ada pesanan untuk diproses"}
         
-        self.order_counter += 1
-        self.current_order.order_id = f"ORD-{self.order_counter}"
+        order_number = self.id_allocator.next_id()
+        self.current_order.order_id = f"ORD-{order_number}"
         self.current_order.customer_name = customer_name
         
-        # Simulasi pemrosesan pesanan
+        # Pesanan baru dilaporkan berhasil setelah tersimpan permanen (group commit + fsync),
+        # agar crash tidak menghilangkan pesanan atau memakai ulang nomornya
+        if self.order_sink is not None:
+            try:
+                self.order_sink.wait(self.order_sink.append(self._order_record(order_number)))
+            except Exception as e:
+                self.current_order.order_id = ""
+                return {"success": False, "message": f"Pesanan gagal disimpan ({e.__cause__ or e}), silakan coba lagi"}
+        
+        estimated_seconds = None
+        estimated_time = "15-20 menit"
+        if self.kitchen is not None:
+            estimated_seconds = self.kitchen.submit(self.current_order.order_id, self.current_order.items)
+            estimated_time = format_eta(estimated_seconds)
+        
         order_result = {
             "success": True,
             "order_id": self.current_order.order_id,
             "customer_name": customer_name,
             "total": self.current_order.total,
-            "estimated_time": "15-20 menit",
+            "estimated_time": estimated_time,
+            "estimated_seconds": estimated_seconds,
             "message": f"Pesanan berhasil! ID: {self.current_order.order_id}"
         }
         
         # Reset order setelah berhasil
         self.current_order = Order()
         return order_result
+    
+    def _order_record(self, order_number: int) -> Dict[str, Any]:
+        order = self.current_order
+        return {
+            "order_id": order.order_id,
+            "order_number": order_number,
+            "customer_name": order.customer_name,
+            "total": order.total,
+            "placed_at": time.time(),
+            "items": [
+                {
+                    "id": item.menu_item.id,
+                    "quantity": item.quantity,
+                    "price": item.menu_item.price,
+                    "category": item.menu_item.category,
+                    "modifiers": item.modifiers,
+                    "special_requests": item.special_requests,
+                }
+                for item in order.items
+            ],
+        }
+
+# Jumlah giliran terakhir yang disimpan di memori per sesi
+HISTORY_MAXLEN = 20
+
+class ConversationHistory:
+    """Riwayat percakapan terbatas (ring buffer) dengan timestamp monotonic
+
+    Jika spill_path diisi, giliran yang terdorong keluar dikumpulkan lalu ditambahkan
+    ke log gzip (JSON per baris) per sesi untuk audit, spill_batch giliran sekaligus.
+    """
+    def __init__(self, maxlen: int = HISTORY_MAXLEN, spill_path: Optional[str] = None, spill_batch: int = 32):
+        self._turns: "deque[Tuple[float, str]]" = deque(maxlen=maxlen)
+        self.spill_path = spill_path
+        self.spill_batch = spill_batch
+        self._pending: List[Tuple[float, str]] = []
+        self.total = 0  # Jumlah semua giliran, termasuk yang sudah keluar dari buffer
+    
+    def __len__(self) -> int:
+        return len(self._turns)
+    
+    def __bool__(self) -> bool:
+        return bool(self._turns)
+    
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        timestamp, user_input = self._turns[index]
+        return {"user": user_input, "timestamp": timestamp}
+    
+    def __iter__(self):
+        for timestamp, user_input in self._turns:
+            yield {"user": user_input, "timestamp": timestamp}
+    
+    def append(self, user_input: str, timestamp: Optional[float] = None):
+        if self.spill_path and len(self._turns) == self._turns.maxlen:
+            self._pending.append(self._turns[0])
+            if len(self._pending) >= self.spill_batch:
+                self.flush()
+        self._turns.append((time.monotonic() if timestamp is None else timestamp, user_input))
+        self.total += 1
+    
+    def last_user_input(self) -> Optional[str]:
+        return self._turns[-1][1] if self._turns else None
+    
+    def flush(self):
+        """Menulis giliran yang tertunda ke log audit"""
+        if not self._pending or not self.spill_path:
+            return
+        # Konversi monotonic -> waktu dinding hanya saat ditulis ke log
+        offset = time.time() - time.monotonic()
+        lines = "".join(json.dumps({"time": timestamp + offset, "user": user_input}, ensure_ascii=False) + "\n"
+                        for timestamp, user_input in self._pending)
+        # Setiap flush menjadi satu member gzip; file multi-member tetap bisa dibaca gzip.open
+        with gzip.open(self.spill_path, "at", encoding="utf-8") as f:
+            f.write(lines)
+        self._pending.clear()
 
 class KafeChatbot:
-    def __init__(self):
-        self.menu_manager = MenuManager()
-        self.order_manager = OrderManager()
+    def __init__(self, menu_manager: Optional[MenuManager] = None, order_manager: Optional[OrderManager] = None):
+        self.menu_manager = menu_manager or MenuManager()
+        self.order_manager = order_manager or OrderManager()
         self.state = ChatbotState.GREETING
-        self.conversation_history = []
+        self.conversation_history = ConversationHistory()
         self.awaiting_confirmation = False
         
     def start(self):
@@ -219,60 +2334,81 @@ Ada yang bisa saya bantu hari ini?
     
     def process_message(self, user_input: str) -> str:
         """Memproses pesan dari user"""
+        return "".join(self._respond(user_input))
+    
+    def stream_message(self, user_input: str) -> Iterator[str]:
+        """Seperti process_message, tetapi balasan dikirim per potongan begitu dibuat
+
+        Menu dikirim per kategori dan pesanan per baris item; gabungan semua potongan
+        sama persis dengan hasil process_message.
+        """
+        return self._respond(user_input)
+    
+    def _respond(self, user_input: str) -> Iterator[str]:
         user_input = user_input.strip()
         
         # Handle quit command
         if user_input.lower() in ['quit', 'q', 'keluar', 'exit']:
-            return self._handle_quit()
+            yield self._handle_quit()
+            return
         
         # Log conversation
-        self.conversation_history.append({"user": user_input, "timestamp": "now"})
+        self.conversation_history.append(user_input)
         
         # Process based on current state
         if self.state == ChatbotState.GREETING:
-            return self._handle_greeting(user_input)
+            yield from self._stream_greeting(user_input)
         elif self.state == ChatbotState.TAKING_ORDER:
-            return self._handle_taking_order(user_input)
+            yield from self._stream_taking_order(user_input)
         elif self.state == ChatbotState.CONFIRMING_ORDER:
-            return self._handle_confirmation(user_input)
+            yield self._handle_confirmation(user_input)
         elif self.state == ChatbotState.WAITING_HUMAN:
-            return self._handle_human_response(user_input)
+            yield self._handle_human_response(user_input)
         else:
-            return "Maaf, terjadi kesalahan sistem. Silakan mulai lagi."
+            yield "Maaf, terjadi kesalahan sistem. Silakan mulai lagi."
     
     def _handle_greeting(self, user_input: str) -> str:
+        return "".join(self._stream_greeting(user_input))
+    
+    def _stream_greeting(self, user_input: str) -> Iterator[str]:
         self.state = ChatbotState.TAKING_ORDER
-        return self._handle_taking_order(user_input)
+        yield from self._stream_taking_order(user_input)
     
     def _handle_taking_order(self, user_input: str) -> str:
-        user_input_lower = user_input.lower()
+        return "".join(self._stream_taking_order(user_input))
+    
+    def _stream_taking_order(self, user_input: str) -> Iterator[str]:
+        # Hasil parse (intent + item) diambil dari cache untuk kalimat yang sering muncul
+        parsed = parse_message(self.menu_manager, user_input)
+        intents = parsed.intents
         
         # Command untuk melihat menu
-        if any(word in user_input_lower for word in ['menu', 'daftar', 'katalog', 'pilihan']):
-            return self._show_menu()
+        if "menu" in intents:
+            yield from self._stream_menu(parsed.categories[0] if parsed.categories else None)
         
         # Command untuk melihat pesanan saat ini
-        if any(word in user_input_lower for word in ['pesanan', 'order', 'keranjang', 'list']):
-            return self._show_current_order()
+        elif "show_order" in intents:
+            yield from self._stream_current_order()
         
         # Command untuk konfirmasi pesanan
-        if any(word in user_input_lower for word in ['konfirmasi', 'confirm', 'pesan', 'bayar', 'selesai']):
-            return self._start_confirmation()
+        elif "confirm_order" in intents:
+            yield from self._stream_confirmation()
         
         # Command untuk membersihkan pesanan
-        if any(word in user_input_lower for word in ['hapus semua', 'clear', 'reset', 'bersihkan']):
+        elif "clear_order" in intents:
             self.order_manager.clear_order()
-            return "✅ Pesanan telah dibersihkan. Silakan mulai memesan lagi!"
+            yield "✅ Pesanan telah dibersihkan. Silakan mulai memesan lagi!"
         
         # Proses pemesanan item
-        return self._process_order_request(user_input)
+        else:
+            yield from self._stream_order_request(user_input, parsed)
     
     def _handle_confirmation(self, user_input: str) -> str:
-        user_input_lower = user_input.lower()
+        intent = INTENT_MATCHER.classify(user_input)
         
-        if any(word in user_input_lower for word in ['ya', 'yes', 'benar', 'ok', 'oke', 'lanjut']):
+        if intent.has("yes"):
             return self._finalize_order()
-        elif any(word in user_input_lower for word in ['tidak', 'no', 'batal', 'ubah']):
+        elif intent.has("no"):
             self.state = ChatbotState.TAKING_ORDER
             return "Baik, Anda bisa mengubah pesanan. Apa yang ingin ditambah atau diubah?"
         else:
@@ -286,163 +2422,87 @@ Ada yang bisa saya bantu hari ini?
     def _handle_quit(self) -> str:
         return "Terima kasih telah menggunakan layanan Kafe Digital! Sampai jumpa! 👋"
     
-    def _show_menu(self) -> str:
+    def _show_menu(self, category: Optional[str] = None) -> str:
         """Tool untuk menampilkan menu"""
-        menu_text = "📜 MENU KAFE DIGITAL 📜\n"
-        menu_text += "=" * 40 + "\n\n"
-        
-        categories = {}
-        for item in self.menu_manager.get_all_menu():
-            if item.category not in categories:
-                categories[item.category] = []
-            categories[item.category].append(item)
-        
-        category_names = {
-            "kopi": "☕ KOPI",
-            "teh": "🍵 TEH", 
-            "dingin": "🧊 MINUMAN DINGIN",
-            "makanan": "🍽️ MAKANAN",
-            "snack": "🍪 SNACK"
-        }
-        
-        for category, items in categories.items():
-            menu_text += f"{category_names.get(category, category.upper())}\n"
-            menu_text += "-" * 25 + "\n"
-            for item in items:
-                menu_text += f"• {item.name} - Rp {item.price:,.0f}\n"
-                menu_text += f"  {item.description}\n\n"
-            menu_text += "\n"
-        
-        menu_text += "💡 Tips: Sebutkan nama minuman/makanan yang Anda inginkan!\n"
-        menu_text += "Contoh: 'Saya mau 2 cappuccino dan 1 sandwich'"
-        
-        return menu_text
+        return self.menu_manager.render_menu(category)
+    
+    def _stream_menu(self, category: Optional[str] = None) -> Iterator[str]:
+        yield from self.menu_manager.iter_menu(category)
     
     def _show_current_order(self) -> str:
         """Tool untuk menampilkan pesanan saat ini"""
         return self.order_manager.get_order_summary()
     
-    def _process_order_request(self, user_input: str) -> str:
+    def _stream_current_order(self) -> Iterator[str]:
+        yield from self.order_manager.iter_order_summary()
+    
+    def _process_order_request(self, user_input: str, parsed: Optional[ParsedMessage] = None) -> str:
         """Tool untuk memproses permintaan pesanan"""
-        # Extract numbers (quantity)
-        numbers = re.findall(r'\d+', user_input)
-        
-        # Search for menu items in user input
-        found_items = []
-        user_input_lower = user_input.lower()
-        
-        for item in self.menu_manager.get_all_menu():
-            # Check if item name is mentioned
-            if item.name.lower() in user_input_lower:
-                found_items.append(item)
-            # Check for partial matches
-            elif any(word in item.name.lower() for word in user_input_lower.split()):
-                found_items.append(item)
-        
-        if not found_items:
+        return "".join(self._stream_order_request(user_input, parsed))
+    
+    def _stream_order_request(self, user_input: str, parsed: Optional[ParsedMessage] = None) -> Iterator[str]:
+        if parsed is None:
+            parsed = parse_message(self.menu_manager, user_input)
+        
+        if not parsed.lines:
             # Try to suggest similar items
-            suggestions = self._get_suggestions(user_input)
+            suggestions = self._get_suggestions(user_input, parsed)
             if suggestions:
-                return f"Maaf, item tidak ditemukan. Mungkin maksud Anda:\n{suggestions}\n\nAtau ketik 'menu' untuk melihat semua pilihan."
+                yield f"Maaf, item tidak ditemukan. Mungkin maksud Anda:\n{suggestions}\n\nAtau ketik 'menu' untuk melihat semua pilihan."
             else:
-                return "Maaf, saya tidak menemukan item yang Anda maksud. Ketik 'menu' untuk melihat semua pilihan yang tersedia."
-        
-        # Add items to order
-        result_messages = []
-        for i, item in enumerate(found_items):
-            quantity = 1
-            if i < len(numbers):
-                quantity = int(numbers[i])
-            elif numbers and i == 0:
-                quantity = int(numbers[0])
-            
-            # Extract modifiers (simplified)
-            modifiers = self._extract_modifiers(user_input)
-            
-            result = self.order_manager.add_to_order(item, quantity, modifiers)
-            result_messages.append(result)
-        
-        response = "\n".join(result_messages)
-        response += f"\n\n{self.order_manager.get_order_summary()}"
-        response += "\n\n💬 Ada lagi yang ingin ditambahkan? Atau ketik 'konfirmasi' untuk melanjutkan pesanan."
-        
-        return response
-    
-    def _extract_modifiers(self, user_input: str) -> List[str]:
-        """Extract modifiers dari input user"""
-        modifiers = []
-        user_input_lower = user_input.lower()
+                yield "Maaf, saya tidak menemukan item yang Anda maksud. Ketik 'menu' untuk melihat semua pilihan yang tersedia."
+            return
         
-        # Check for size modifiers
-        if any(word in user_input_lower for word in ['large', 'besar', 'jumbo']):
-            modifiers.append("large")
-        elif any(word in user_input_lower for word in ['small', 'kecil']):
-            modifiers.append("small")
-        else:
-            modifiers.append("medium")
-        
-        # Check for milk modifiers
-        if any(word in user_input_lower for word in ['soy', 'kedelai']):
-            modifiers.append("soy")
-        elif any(word in user_input_lower for word in ['almond']):
-            modifiers.append("almond")
-        elif any(word in user_input_lower for word in ['oat']):
-            modifiers.append("oat")
-        
-        # Check for sugar modifiers
-        if any(word in user_input_lower for word in ['tanpa gula', 'no sugar', 'sugar free']):
-            modifiers.append("tanpa_gula")
-        elif any(word in user_input_lower for word in ['extra manis', 'very sweet']):
-            modifiers.append("extra_manis")
-        
-        # Check for temperature
-        if any(word in user_input_lower for word in ['es', 'dingin', 'cold', 'iced']):
-            modifiers.append("dingin")
-        elif any(word in user_input_lower for word in ['panas', 'hot']):
-            modifiers.append("panas")
+        # Semua item ditambahkan dulu sebelum potongan pertama dikirim: jika pembaca berhenti
+        # di tengah stream (koneksi putus), keranjang tidak tersimpan setengah jadi
+        results = []
+        for line in parsed.lines:
+            item = self.menu_manager.get_item_by_id(line.item_id)
+            results.append(self.order_manager.add_to_order(item, line.quantity, list(line.modifiers)))
         
-        return modifiers
+        yield "\n".join(results)
+        yield "\n\n"
+        yield from self.order_manager.iter_order_summary()
+        yield "\n\n💬 Ada lagi yang ingin ditambahkan? Atau ketik 'konfirmasi' untuk melanjutkan pesanan."
     
-    def _get_suggestions(self, user_input: str) -> str:
+    def _get_suggestions(self, user_input: str, parsed: Optional[ParsedMessage] = None) -> str:
         """Memberikan saran berdasarkan input user"""
-        user_input_lower = user_input.lower()
+        if parsed is None:
+            parsed = parse_message(self.menu_manager, user_input)
         suggestions = []
         
-        # Keyword matching for suggestions
-        if any(word in user_input_lower for word in ['kopi', 'coffee']):
-            kopi_items = self.menu_manager.get_menu_by_category("kopi")[:3]
-            suggestions.extend([f"• {item.name}" for item in kopi_items])
-        
-        if any(word in user_input_lower for word in ['teh', 'tea']):
-            teh_items = self.menu_manager.get_menu_by_category("teh")[:3]
-            suggestions.extend([f"• {item.name}" for item in teh_items])
+        # Item dengan nama mirip (typo yang belum cukup yakin untuk langsung diterima)
+        for item in self.menu_manager.suggest_items(user_input):
+            suggestions.append(f"• {item.name}")
         
-        if any(word in user_input_lower for word in ['makanan', 'makan', 'food']):
-            makanan_items = self.menu_manager.get_menu_by_category("makanan")[:3]
-            suggestions.extend([f"• {item.name}" for item in makanan_items])
+        # Keyword matching for suggestions
+        for category in parsed.categories:
+            items = self.menu_manager.get_menu_by_category(category)[:3]
+            suggestions.extend([f"• {item.name}" for item in items if f"• {item.name}" not in suggestions])
         
         return "\n".join(suggestions) if suggestions else ""
     
     def _start_confirmation(self) -> str:
         """Tool untuk memulai konfirmasi pesanan"""
-        confirmation_result = self.order_manager.confirm_order()
-        
-        if not confirmation_result["success"]:
-            return confirmation_result["message"]
+        return "".join(self._stream_confirmation())
+    
+    def _stream_confirmation(self) -> Iterator[str]:
+        # Ringkasan dikirim per baris, tanpa merangkai seluruh teks lewat confirm_order()
+        if not self.order_manager.current_order.items:
+            yield self.order_manager.confirm_order()["message"]
+            return
         
         self.state = ChatbotState.CONFIRMING_ORDER
-        response = confirmation_result["order_summary"]
-        response += "\n\n❓ Apakah pesanan sudah benar? (ya/tidak)"
-        response += "\nJika ya, silakan berikan nama Anda untuk pesanan."
-        
-        return response
+        yield from self.order_manager.iter_order_summary()
+        yield "\n\n❓ Apakah pesanan sudah benar? (ya/tidak)"
+        yield "\nJika ya, silakan berikan nama Anda untuk pesanan."
     
     def _finalize_order(self) -> str:
         """Tool untuk finalisasi pesanan"""
         # Extract customer name from conversation history
         customer_name = "Pelanggan"
         if self.conversation_history:
-            last_input = self.conversation_history[-1]["user"]
+            last_input = self.conversation_history.last_user_input()
             # Simple name extraction
             words = last_input.split()
             if len(words) >= 2 and not any(word.lower() in ['ya', 'yes', 'ok', 'oke'] for word in words):
@@ -472,9 +2532,1056 @@ Ketik pesan apapun untuk memulai pesanan baru.
         else:
             return f"❌ Gagal memproses pesanan: {order_result['message']}"
 
+@dataclass(slots=True)
+class SessionState:
+    """Record state ringkas untuk satu pelanggan"""
+    state: ChatbotState = ChatbotState.GREETING
+    order: Order = field(default_factory=Order)
+    history: ConversationHistory = field(default_factory=ConversationHistory)
+    last_active: float = 0.0
+
+# Format biner sesi: header (versi, kode state, jumlah baris, waktu simpan) lalu baris-baris
+# (panjang id, jumlah, modifier mask, panjang catatan) + id + catatan dalam UTF-8
+SESSION_FORMAT_VERSION = 1
+_SESSION_HEADER = struct.Struct("<BBHI")
+_SESSION_LINE = struct.Struct("<HIIH")
+_STATE_CODES = {state: code for code, state in enumerate(ChatbotState)}
+_CODE_STATES = list(ChatbotState)
+
+def encode_session(session: SessionState) -> bytes:
+    """Mengemas state dan baris keranjang sesi menjadi bytes ringkas"""
+    # Salin dulu: writer store berjalan di thread lain sementara request bisa mengubah keranjang
+    items = list(session.order.items)
+    parts = [_SESSION_HEADER.pack(SESSION_FORMAT_VERSION, _STATE_CODES[session.state], len(items), int(time.time()))]
+    for item in items:
+        item_id = item.menu_item.id.encode("utf-8")
+        special = item.special_requests.encode("utf-8")
+        # Jumlah dibatasi seperti di keranjang agar selalu muat di field <I
+        quantity = min(max(item.quantity, 0), MAX_QUANTITY)
+        parts.append(_SESSION_LINE.pack(len(item_id), quantity, item.modifier_mask, len(special)))
+        parts.append(item_id)
+        parts.append(special)
+    return b"".join(parts)
+
+def decode_session(data: bytes, menu_manager: MenuManager, max_age: Optional[float] = None) -> Optional[Tuple[ChatbotState, Order]]:
+    """Kebalikan encode_session; item yang sudah tidak dijual dibuang, harga mengikuti katalog saat ini
+
+    Mengembalikan None jika versi format tidak dikenal atau data lebih tua dari max_age detik.
+    Data terpotong atau rusak melempar struct.error atau ValueError.
+    """
+    version, state_code, line_count, saved_at = _SESSION_HEADER.unpack_from(data, 0)
+    if version != SESSION_FORMAT_VERSION or (max_age is not None and time.time() - saved_at > max_age):
+        return None
+    if state_code >= len(_CODE_STATES):
+        raise ValueError(f"kode state tidak dikenal: {state_code}")
+    order = Order()
+    offset = _SESSION_HEADER.size
+    for _ in range(line_count):
+        id_length, quantity, modifier_mask, special_length = _SESSION_LINE.unpack_from(data, offset)
+        offset += _SESSION_LINE.size
+        item_id = data[offset:offset + id_length].decode("utf-8")
+        offset += id_length
+        special = data[offset:offset + special_length].decode("utf-8")
+        offset += special_length
+        if offset > len(data) or not 0 < quantity <= MAX_QUANTITY:
+            raise ValueError("baris keranjang terpotong atau rusak")
+        menu_item = menu_manager.get_item_by_id(item_id)
+        if menu_item is None or not menu_item.available:
+            continue
+        item = OrderItem(menu_item, quantity, modifier_mask, special)
+        order.items.append(item)
+        order.total += item.subtotal
+    if len(order.items) > LINE_INDEX_THRESHOLD:
+        order.lines = {item.key: item for item in order.items}
+    return _CODE_STATES[state_code], order
+
+class SessionStore(ABC):
+    """Penyimpanan sesi persisten (pluggable); nilai berupa bytes dari encode_session"""
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[bytes]:
+        """Data sesi tersimpan, atau None jika tidak ada"""
+    
+    @abstractmethod
+    def save_many(self, records: Dict[str, Optional[bytes]]):
+        """Menyimpan banyak sesi sekaligus; nilai None berarti sesi dihapus"""
+    
+    def close(self):
+        pass
+
+class MemorySessionStore(SessionStore):
+    """Store di memori proses, untuk pengujian dan deployment satu proses"""
+    def __init__(self):
+        self._data: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def load(self, session_id: str) -> Optional[bytes]:
+        return self._data.get(session_id)
+    
+    def save_many(self, records: Dict[str, Optional[bytes]]):
+        with self._lock:
+            for session_id, data in records.items():
+                if data is None:
+                    self._data.pop(session_id, None)
+                else:
+                    self._data[session_id] = data
+
+class SqliteSessionStore(SessionStore):
+    """Store SQLite lokal (WAL); satu file bisa dipakai bersama oleh beberapa proses worker"""
+    def __init__(self, path: str = "sessions.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, data BLOB NOT NULL) WITHOUT ROWID")
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+    
+    def load(self, session_id: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._db.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row is not None else None
+    
+    def save_many(self, records: Dict[str, Optional[bytes]]):
+        upserts = [(session_id, data) for session_id, data in records.items() if data is not None]
+        deletes = [(session_id,) for session_id, data in records.items() if data is None]
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO sessions (session_id, data) VALUES (?, ?)", upserts)
+                self._db.executemany("DELETE FROM sessions WHERE session_id = ?", deletes)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+    
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+class SessionManager:
+    """Registry sesi: banyak pelanggan berbagi satu MenuManager dan satu penghasil ID pesanan"""
+    def __init__(self, menu_manager: Optional[MenuManager] = None, id_allocator: Optional[OrderIdAllocator] = None,
+                 ttl: float = 1800.0, max_sessions: int = 50000, order_sink: Optional[OrderSink] = None,
+                 history_dir: Optional[str] = None, kitchen: Optional[KitchenQueue] = None,
+                 store: Optional[SessionStore] = None, store_batch: int = 256, store_interval: float = 1.0):
+        # MenuManager dipakai bersama dan hanya dibaca oleh sesi
+        self.menu_manager = menu_manager or MenuManager()
+        self.order_sink = order_sink
+        self.kitchen = kitchen
+        if id_allocator is None:
+            last_number = order_sink.last_order_number() if order_sink is not None else None
+            id_allocator = OrderIdAllocator(last_number if last_number is not None else 1000)
+        self.id_allocator = id_allocator
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        # Direktori log audit percakapan per sesi (opsional)
+        self.history_dir = history_dir
+        if history_dir:
+            os.makedirs(history_dir, exist_ok=True)
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Store persisten opsional: dibaca saat cache miss (read-through), ditulis per batch
+        # (write-behind) oleh thread writer setiap store_batch sesi berubah atau setelah
+        # store_interval detik, jadi transaksi store tidak berjalan di jalur pesan
+        self.store = store
+        self.store_batch = store_batch
+        self.store_interval = store_interval
+        self._dirty: Dict[str, Optional[SessionState]] = {}  # None = hapus dari store
+        self._flushing: Dict[str, Optional[SessionState]] = {}
+        self._flush_lock = threading.Lock()
+        self._store_cond = threading.Condition(self._lock)
+        self._store_closed = False
+        self._store_writer: Optional[threading.Thread] = None
+        if store is not None:
+            self._store_writer = threading.Thread(target=self._store_loop, name="kafe-session-store", daemon=True)
+            self._store_writer.start()
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
+    
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+    
+    def get_session(self, session_id: str) -> SessionState:
+        """Mengambil (atau membuat) sesi dan menandainya sebagai baru dipakai"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._new_session(session_id)
+                if self.store is not None:
+                    self._restore(session_id, session)
+                self._sessions[session_id] = session
+                # Evict LRU jika jumlah sesi melebihi batas
+                while len(self._sessions) > self.max_sessions:
+                    self._evict(*self._sessions.popitem(last=False))
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_active = now
+            return session
+    
+    def _new_session(self, session_id: str) -> SessionState:
+        spill_path = None
+        if self.history_dir:
+            safe_id = re.sub(r"[^\w.-]", "_", session_id)
+            spill_path = os.path.join(self.history_dir, f"{safe_id}.log.gz")
+        return SessionState(history=ConversationHistory(spill_path=spill_path))
+    
+    def _restore(self, session_id: str, session: SessionState):
+        # Perubahan yang belum sampai ke store lebih baru daripada isi store
+        for pending in (self._dirty, self._flushing):
+            if session_id in pending:
+                saved = pending[session_id]
+                if saved is not None:
+                    session.state, session.order = saved.state, saved.order
+                return
+        data = self.store.load(session_id)
+        try:
+            restored = decode_session(data, self.menu_manager, self.ttl) if data is not None else None
+        except (struct.error, ValueError) as e:
+            # Baris rusak dianggap tidak ada (sesi mulai baru) dan dihapus dari store
+            print(f"⚠️ Sesi {session_id} di store rusak, diabaikan: {e}", file=sys.stderr)
+            self._dirty[session_id] = None
+            restored = None
+        if restored is not None:
+            session.state, session.order = restored
+    
+    def _evict(self, session_id: str, session: SessionState, forget: bool = False):
+        # Sesi yang dikeluarkan karena LRU tetap ada di store; yang kedaluwarsa/diakhiri dihapus
+        session.history.flush()
+        if forget and self.store is not None:
+            self._dirty[session_id] = None
+    
+    def flush_sessions(self):
+        """Menulis semua sesi yang berubah ke store dalam satu transaksi
+
+        Setiap sesi di-encode sendiri: sesi yang gagal di-encode dilewati tanpa menggagalkan
+        sesi lain. Jika transaksi gagal, perubahan dikembalikan ke antrian untuk dicoba lagi.
+        """
+        if self.store is None:
+            return
+        with self._flush_lock:
+            with self._lock:
+                self._flushing, self._dirty = self._dirty, {}
+                records: Dict[str, Optional[bytes]] = {}
+                for session_id, session in self._flushing.items():
+                    try:
+                        records[session_id] = encode_session(session) if session is not None else None
+                    except (struct.error, ValueError) as e:
+                        print(f"⚠️ Sesi {session_id} tidak bisa disimpan: {e}", file=sys.stderr)
+            try:
+                if records:
+                    self.store.save_many(records)
+            except Exception:
+                with self._lock:
+                    # Perubahan yang masuk selama transaksi lebih baru, jadi tidak ditimpa
+                    for session_id, session in self._flushing.items():
+                        self._dirty.setdefault(session_id, session)
+                raise
+            finally:
+                with self._lock:
+                    self._flushing = {}
+    
+    def _store_loop(self):
+        while True:
+            with self._lock:
+                self._store_cond.wait_for(lambda: self._store_closed or len(self._dirty) >= self.store_batch,
+                                          self.store_interval)
+                if self._store_closed:
+                    return
+            try:
+                self.flush_sessions()
+            except Exception as e:
+                print(f"⚠️ Gagal menyimpan sesi, dicoba lagi: {e}", file=sys.stderr)
+    
+    def close(self):
+        """Menulis giliran riwayat yang masih tertunda dan sisa sesi ke store lalu menutupnya"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.history.flush()
+        if self.store is not None:
+            with self._lock:
+                self._store_closed = True
+                self._store_cond.notify_all()
+            self._store_writer.join()
+            self.flush_sessions()
+            self.store.close()
+    
+    def reload_catalog(self, catalog_path: str, outlet: Optional[str] = None):
+        """Hot reload: bangun MenuManager baru lalu tukar referensinya dalam satu langkah"""
+        menu_manager = load_menu_manager(catalog_path, outlet)
+        menu_manager._ensure_index()  # Siapkan index sebelum dipakai sesi
+        self.menu_manager = menu_manager
+    
+    def peek_state(self, session_id: str) -> Optional[ChatbotState]:
+        """Melihat state sesi tanpa mengubah urutan LRU"""
+        session = self._sessions.get(session_id)
+        return session.state if session is not None else None
+    
+    def end_session(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                if self.store is not None:
+                    self._dirty[session_id] = None
+                return False
+            self._evict(session_id, session, forget=True)
+            return True
+    
+    def _evict_expired(self, now: float):
+        # Sesi terurut dari yang paling lama tidak aktif, cukup cek dari depan
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_active < self.ttl:
+                break
+            self._evict(*self._sessions.popitem(last=False), forget=True)
+    
+    def bind(self, session: SessionState) -> KafeChatbot:
+        """Membuat KafeChatbot ringan yang memakai state dari sesi"""
+        chatbot = KafeChatbot(self.menu_manager, OrderManager(self.id_allocator, self.order_sink, self.kitchen))
+        chatbot.state = session.state
+        chatbot.order_manager.current_order = session.order
+        chatbot.conversation_history = session.history
+        return chatbot
+    
+    def _store(self, chatbot: KafeChatbot, session: SessionState):
+        session.state = chatbot.state
+        session.order = chatbot.order_manager.current_order
+        session.history = chatbot.conversation_history
+        # Reset state jika pesanan selesai, sama seperti main()
+        if session.state == ChatbotState.ORDER_COMPLETE:
+            session.state = ChatbotState.TAKING_ORDER
+    
+    def process_message(self, session_id: str, user_input: str) -> str:
+        """Memproses pesan untuk sesi tertentu"""
+        session = self.get_session(session_id)
+        chatbot = self.bind(session)
+        response = chatbot.process_message(user_input)
+        self._finish(session_id, chatbot, session)
+        return response
+    
+    def stream_message(self, session_id: str, user_input: str) -> Iterator[str]:
+        """Seperti process_message, tetapi potongan balasan diteruskan begitu dibuat"""
+        session = self.get_session(session_id)
+        chatbot = self.bind(session)
+        try:
+            yield from chatbot.stream_message(user_input)
+        finally:
+            # Tetap disimpan walau pembaca berhenti di tengah (mis. koneksi putus)
+            self._finish(session_id, chatbot, session)
+    
+    def _finish(self, session_id: str, chatbot: KafeChatbot, session: SessionState):
+        self._store(chatbot, session)
+        if self.store is not None:
+            with self._lock:
+                self._dirty[session_id] = session
+                if len(self._dirty) >= self.store_batch:
+                    self._store_cond.notify_all()
+
+class Metrics:
+    """Histogram latensi dan counter sederhana, bisa diekspor sebagai teks Prometheus atau JSON"""
+    BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+    
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        # (nama, label) -> [jumlah per bucket..., +Inf], total detik, jumlah observasi
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[Any]] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], int] = {}
+    
+    def observe(self, name: str, seconds: float, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.BUCKETS) + 1), 0.0, 0]
+            buckets = histogram[0]
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[-1] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+    
+    def inc(self, name: str, value: int = 1, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+    
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+    
+    @staticmethod
+    def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+        parts = [f'{key}="{value}"' for key, value in labels]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+    
+    def to_prometheus(self) -> str:
+        """Snapshot dalam format teks Prometheus"""
+        with self._lock:
+            histograms = {key: (list(h[0]), h[1], h[2]) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = []
+        for name in sorted({key[0] for key in histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket in zip(self.BUCKETS + (float("inf"),), buckets):
+                    cumulative += bucket
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                    lines.append(f"{name}_bucket{self._format_labels(labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {total:.9f}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {count}")
+        for name in sorted({key[0] for key in counters}):
+            lines.append(f"# TYPE {name} counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{self._format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+    
+    def to_json(self) -> str:
+        """Snapshot dalam format JSON"""
+        with self._lock:
+            data = {
+                "histograms": [
+                    {"name": name, "labels": dict(labels), "buckets": dict(zip(map(str, self.BUCKETS + ("+Inf",)), h[0])),
+                     "sum": h[1], "count": h[2]}
+                    for (name, labels), h in sorted(self._histograms.items())
+                ],
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self._counters.items())
+                ],
+            }
+        return json.dumps(data, ensure_ascii=False, indent=2)
+
+METRICS = Metrics()
+_metrics_context = threading.local()
+
+# (kelas, method, intent yang ditandai saat method dipanggil)
+_INSTRUMENTED_METHODS = [
+    ("KafeChatbot", "_stream_greeting", None),
+    ("KafeChatbot", "_stream_taking_order", None),
+    ("KafeChatbot", "_handle_confirmation", None),
+    ("KafeChatbot", "_handle_human_response", None),
+    ("KafeChatbot", "_stream_menu", "menu"),
+    ("KafeChatbot", "_stream_current_order", "show_order"),
+    ("KafeChatbot", "_stream_confirmation", "confirm_order"),
+    ("KafeChatbot", "_stream_order_request", "order"),
+    ("KafeChatbot", "_finalize_order", "finalize_order"),
+    ("IntentMatcher", "classify", None),
+    (None, "parse_message", None),
+    ("MenuManager", "correct_tokens", None),
+    (None, "_scan_tokens", None),
+    (None, "_bind_mentions", None),  # Ekstraksi modifier: modifier diikat ke item di fase ini
+    ("MenuManager", "iter_menu", None),
+    ("OrderManager", "add_to_order", None),
+    ("OrderManager", "clear_order", "clear_order"),
+    ("OrderManager", "iter_order_summary", None),
+    ("OrderManager", "place_order", None),
+]
+_original_methods: Dict[Tuple[Optional[str], str], Any] = {}
+
+def _timed(function, label: str, intent: Optional[str]):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        context = _metrics_context
+        if intent is not None and getattr(context, "intent", None) is None:
+            context.intent = intent
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            METRICS.observe("kafe_handler_seconds", time.perf_counter() - start,
+                            handler=label, state=getattr(context, "state", "-"))
+    return wrapper
+
+def _timed_stream(function, label: str, intent: Optional[str]):
+    # Untuk generator: hanya waktu saat generator berjalan yang dihitung, bukan jeda
+    # di antara potongan (mis. menunggu klien lambat)
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        context = _metrics_context
+        if intent is not None and getattr(context, "intent", None) is None:
+            context.intent = intent
+        chunks = function(*args, **kwargs)
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield chunk
+        finally:
+            chunks.close()
+            METRICS.observe("kafe_handler_seconds", elapsed, handler=label, state=getattr(context, "state", "-"))
+    return wrapper
+
+def _timed_message(function):
+    @functools.wraps(function)
+    def wrapper(self, user_input: str) -> str:
+        context = _metrics_context
+        state = context.state = self.state.value
+        context.intent = None
+        start = time.perf_counter()
+        try:
+            return function(self, user_input)
+        finally:
+            intent = context.intent or "other"
+            METRICS.observe("kafe_message_seconds", time.perf_counter() - start, state=state, intent=intent)
+            METRICS.inc("kafe_messages_total", state=state, intent=intent)
+            context.state = "-"
+    return wrapper
+
+def _timed_message_stream(function):
+    # Generator sesi lain bisa berjalan berselang-seling di thread yang sama (event loop server),
+    # jadi state dan intent disimpan di variabel lokal dan baru dipasang ke _metrics_context
+    # selama generator ini sendiri yang berjalan
+    @functools.wraps(function)
+    def wrapper(self, user_input: str) -> Iterator[str]:
+        context = _metrics_context
+        state, intent = self.state.value, None
+        chunks = None
+        elapsed = 0.0
+        try:
+            while True:
+                outer = (getattr(context, "state", "-"), getattr(context, "intent", None))
+                context.state, context.intent = state, intent
+                start = time.perf_counter()
+                try:
+                    if chunks is None:
+                        chunks = function(self, user_input)
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                    intent = context.intent
+                    context.state, context.intent = outer
+                yield chunk
+        finally:
+            if chunks is not None:
+                outer = (getattr(context, "state", "-"), getattr(context, "intent", None))
+                context.state, context.intent = state, intent
+                try:
+                    chunks.close()
+                finally:
+                    context.state, context.intent = outer
+            METRICS.observe("kafe_message_seconds", elapsed, state=state, intent=intent or "other")
+            METRICS.inc("kafe_messages_total", state=state, intent=intent or "other")
+    return wrapper
+
+def _counted_suggestions(function):
+    # _get_suggestions hanya dipanggil saat tidak ada item yang cocok
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        suggestions = function(*args, **kwargs)
+        state = getattr(_metrics_context, "state", "-")
+        METRICS.observe("kafe_handler_seconds", time.perf_counter() - start, handler="KafeChatbot._get_suggestions", state=state)
+        METRICS.inc("kafe_match_miss_total", state=state)
+        if suggestions:
+            METRICS.inc("kafe_suggestion_fallback_total", state=state)
+        return suggestions
+    return wrapper
+
+def enable_metrics():
+    """Memasang wrapper pengukur waktu; tanpa ini tidak ada overhead sama sekali"""
+    if METRICS.enabled:
+        return
+    classes = globals()
+    targets = [
+        ("KafeChatbot", "process_message", _timed_message),
+        ("KafeChatbot", "stream_message", _timed_message_stream),
+        ("KafeChatbot", "_get_suggestions", _counted_suggestions),
+    ]
+    for class_name, method, intent in _INSTRUMENTED_METHODS:
+        timer = _timed_stream if method.startswith(("_stream_", "iter_")) else _timed
+        label = f"{class_name}.{method}" if class_name else method
+        targets.append((class_name, method, functools.partial(timer, label=label, intent=intent)))
+    for class_name, method, make_wrapper in targets:
+        # class_name None berarti fungsi tingkat modul (dipanggil lewat nama global)
+        original = classes[class_name].__dict__[method] if class_name else classes[method]
+        _original_methods[(class_name, method)] = original
+        _set_instrumented(class_name, method, make_wrapper(original))
+    METRICS.enabled = True
+
+def _set_instrumented(class_name: Optional[str], method: str, function):
+    if class_name:
+        setattr(globals()[class_name], method, function)
+    else:
+        globals()[method] = function
+
+def disable_metrics():
+    """Mengembalikan method asli (data metrik tetap tersimpan)"""
+    for (class_name, method), original in _original_methods.items():
+        _set_instrumented(class_name, method, original)
+    _original_methods.clear()
+    METRICS.enabled = False
+
+def install_metrics_signal(path: str = "metrics.json", signum: int = getattr(signal, "SIGUSR1", 0)) -> bool:
+    """Menulis snapshot JSON ke path setiap kali proses menerima sinyal (default SIGUSR1)"""
+    if not signum:
+        return False  # Platform tanpa SIGUSR1 (mis. Windows)
+    
+    def dump(_signum, _frame):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(METRICS.to_json())
+    
+    signal.signal(signum, dump)
+    return True
+
+ORDER_LOG_PATH = "orders.jsonl"
+# Penempatan pesanan yang bisa berjalan bersamaan per server/worker; batch log pesanan disamakan
+# sehingga group commit langsung ditulis begitu semua penempatan yang berjalan sudah masuk
+ORDER_WORKERS = 32
+# File katalog (JSON/CSV/.kcat) dan outlet opsional; kosong berarti memakai menu bawaan
+CATALOG_PATH = os.environ.get("KAFE_CATALOG", "")
+CATALOG_OUTLET = os.environ.get("KAFE_OUTLET") or None
+# Snapshot MenuManager + index untuk start-up cepat; kosong berarti selalu dibangun dari katalog
+SNAPSHOT_PATH = os.environ.get("KAFE_SNAPSHOT", "")
+# File SQLite untuk menyimpan keranjang sesi server; kosong berarti sesi hanya di memori
+SESSION_DB_PATH = os.environ.get("KAFE_SESSION_DB", "")
+# KAFE_METRICS=1 mengaktifkan instrumentasi di mode CLI dan server
+METRICS_ENABLED = os.environ.get("KAFE_METRICS", "") not in ("", "0")
+# KAFE_ANALYTICS=1 menyalakan analitik penjualan di server (butuh numpy), dimuat dari log pesanan
+ANALYTICS_ENABLED = os.environ.get("KAFE_ANALYTICS", "") not in ("", "0")
+
+def _session_store(path: str = SESSION_DB_PATH) -> Optional[SessionStore]:
+    return SqliteSessionStore(path) if path else None
+
+def _setup_metrics():
+    if METRICS_ENABLED:
+        enable_metrics()
+        install_metrics_signal()
+
+class ChatServer:
+    """Server asyncio berbasis JSON per baris untuk melayani banyak sesi sekaligus
+
+    Request : {"session_id": "...", "message": "...", "id": opsional, "stream": opsional}
+    Response: {"session_id": "...", "response": "...", "id": ...} atau {"error": "..."}
+    Stream  : dengan "stream": true, {"session_id", "id", "chunk": "..."} per potongan
+              lalu {"session_id", "id", "done": true}
+    Metrik  : {"command": "metrics", "format": "prometheus" | "json"} -> {"metrics": "..."}
+    Analitik: {"command": "analytics", "top": opsional} -> {"analytics": {...}}
+    """
+    def __init__(self, session_manager: Optional[SessionManager] = None, host: str = "127.0.0.1", port: int = 8765,
+                 max_concurrency: int = 64, max_pending_per_connection: int = 32, order_workers: int = ORDER_WORKERS,
+                 analytics: Optional[OrderAnalytics] = None):
+        self.session_manager = session_manager if session_manager is not None else SessionManager()
+        self.analytics = analytics
+        self.host = host
+        self.port = port
+        self.max_concurrency = max_concurrency
+        self.max_pending_per_connection = max_pending_per_connection
+        self.order_workers = order_workers
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        # session_id -> [lock, jumlah pemakai]; dihapus saat tidak dipakai lagi
+        self._session_locks: Dict[str, List[Any]] = {}
+    
+    async def start(self):
+        from concurrent.futures import ThreadPoolExecutor
+        
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.order_workers, thread_name_prefix="kafe-order")
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        sockets = self._server.sockets or []
+        if sockets:
+            self.port = sockets[0].getsockname()[1]
+    
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        print(f"🚀 Server Kafe Digital berjalan di {self.host}:{self.port}")
+        async with self._server:
+            await self._server.serve_forever()
+    
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+    
+    async def handle_message(self, session_id: str, message: str) -> str:
+        """Memproses satu pesan; pesan dalam satu sesi diproses berurutan"""
+        async with self._session_turn(session_id):
+            return await self._dispatch(session_id, message)
+    
+    async def stream_message(self, session_id: str, message: str, send):
+        """Seperti handle_message, tetapi setiap potongan balasan dikirim lewat send() begitu jadi"""
+        async with self._session_turn(session_id):
+            await self._dispatch_stream(session_id, message, send)
+    
+    @contextlib.asynccontextmanager
+    async def _session_turn(self, session_id: str):
+        entry = self._session_locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            # asyncio.Lock bersifat FIFO sehingga urutan pesan per sesi terjaga
+            async with entry[0], self._semaphore:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._session_locks[session_id]
+    
+    async def _dispatch(self, session_id: str, message: str) -> str:
+        # Hanya pesan pada state konfirmasi yang bisa menempatkan pesanan;
+        # jalankan di thread pool agar sink pesanan yang lambat tidak menahan event loop
+        if self.session_manager.peek_state(session_id) == ChatbotState.CONFIRMING_ORDER:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self.session_manager.process_message, session_id, message)
+        return self.session_manager.process_message(session_id, message)
+    
+    async def _dispatch_stream(self, session_id: str, message: str, send):
+        # Penempatan pesanan tetap lewat thread pool dan balasannya dikirim utuh
+        if self.session_manager.peek_state(session_id) == ChatbotState.CONFIRMING_ORDER:
+            await send(await self._dispatch(session_id, message))
+            return
+        # Generator dijalankan di event loop; menunggu drain di antara potongan memberi backpressure
+        for chunk in self.session_manager.stream_message(session_id, message):
+            await send(chunk)
+    
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Backpressure: berhenti membaca jika terlalu banyak request yang belum selesai
+        pending = asyncio.Semaphore(self.max_pending_per_connection)
+        write_lock = asyncio.Lock()
+        tasks = set()
+        
+        async def respond(payload: Dict[str, Any]):
+            async with write_lock:
+                writer.write((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+                await writer.drain()
+        
+        async def run(request: Dict[str, Any]):
+            try:
+                session_id = str(request["session_id"])
+                if request.get("stream"):
+                    async def send(chunk: str):
+                        await respond({"id": request.get("id"), "session_id": session_id, "chunk": chunk})
+                    
+                    await self.stream_message(session_id, str(request["message"]), send)
+                    await respond({"id": request.get("id"), "session_id": session_id, "done": True})
+                    return
+                response = await self.handle_message(session_id, str(request["message"]))
+                await respond({"id": request.get("id"), "session_id": session_id, "response": response})
+            except Exception as e:
+                await respond({"id": request.get("id"), "error": str(e)})
+            finally:
+                pending.release()
+        
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                    if isinstance(request, dict) and request.get("command") == "metrics":
+                        metrics = METRICS.to_json() if request.get("format") == "json" else METRICS.to_prometheus()
+                        await respond({"id": request.get("id"), "metrics": metrics})
+                        continue
+                    if isinstance(request, dict) and request.get("command") == "analytics":
+                        try:
+                            top = int(request.get("top", 10))
+                        except (TypeError, ValueError):
+                            top = 0
+                        if self.analytics is None:
+                            await respond({"id": request.get("id"), "error": "Analitik penjualan tidak aktif"})
+                        elif top <= 0:
+                            await respond({"id": request.get("id"), "error": "'top' harus bilangan bulat positif"})
+                        else:
+                            # Query besar berjalan di thread pool agar event loop tetap responsif
+                            loop = asyncio.get_running_loop()
+                            summary = await loop.run_in_executor(self._executor, self.analytics.summary, top)
+                            await respond({"id": request.get("id"), "analytics": summary})
+                        continue
+                    if not isinstance(request, dict) or "session_id" not in request or "message" not in request:
+                        raise ValueError("Request harus berisi 'session_id' dan 'message'")
+                except ValueError as e:
+                    await respond({"error": f"Request tidak valid: {e}"})
+                    continue
+                await pending.acquire()
+                task = asyncio.create_task(run(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+class HashRing:
+    """Consistent hashing: setiap node punya banyak titik virtual di ring crc32"""
+    def __init__(self, nodes: Iterable[Any], replicas: int = 128):
+        self._points = sorted((zlib.crc32(f"{node}#{i}".encode("utf-8")), node)
+                              for node in nodes for i in range(replicas))
+        self._hashes = [point for point, _ in self._points]
+    
+    def node_for(self, key: str) -> Any:
+        i = bisect.bisect(self._hashes, zlib.crc32(key.encode("utf-8")))
+        return self._points[i % len(self._points)][1]
+
+@functools.lru_cache(maxsize=None)
+def _kitchen_manager_class():
+    """Kelas manager yang memegang satu KitchenQueue bersama untuk semua worker (diimpor saat dipakai)"""
+    from multiprocessing.managers import BaseManager
+    
+    class KitchenManager(BaseManager):
+        pass
+    
+    KitchenManager.register("KitchenQueue", KitchenQueue)
+    return KitchenManager
+
+def _shard_log_path(order_log_path: str, index: int) -> str:
+    root, ext = os.path.splitext(order_log_path)
+    return f"{root}-w{index}{ext}"
+
+def _run_shard_worker(conn, menu_manager: Optional[MenuManager], catalog_path: Optional[str], outlet: Optional[str],
+                      id_allocator: OrderIdAllocator, order_log_path: str, kitchen: Optional[KitchenQueue],
+                      session_db_path: str = ""):
+    """Loop proses worker: terima (id, session_id, pesan) dari pipe, balas (id, respons, error)"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C ditangani proses utama
+    if menu_manager is None:
+        menu_manager = load_menu_manager(catalog_path, outlet)
+    from concurrent.futures import ThreadPoolExecutor
+    
+    order_log = JsonlOrderLog(order_log_path, batch_size=ORDER_WORKERS)
+    # Koneksi SQLite dibuka di worker (tidak diwariskan lewat fork); file dipakai bersama semua worker
+    session_manager = SessionManager(menu_manager, id_allocator, order_sink=order_log, kitchen=kitchen,
+                                     store=_session_store(session_db_path))
+    # Pesan yang bisa menempatkan pesanan diproses di pool agar beberapa pesanan menunggu fsync
+    # yang sama; urutan per sesi dijaga proses utama (satu request per sesi yang berjalan)
+    executor = ThreadPoolExecutor(max_workers=ORDER_WORKERS, thread_name_prefix="kafe-order")
+    send_lock = threading.Lock()
+    
+    def handle(request_id: int, session_id: str, message: str):
+        try:
+            response = (request_id, session_manager.process_message(session_id, message), None)
+        except Exception as e:
+            response = (request_id, None, str(e))
+        with send_lock:
+            conn.send(response)
+    
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+            request_id, session_id, message = request
+            if session_manager.peek_state(session_id) == ChatbotState.CONFIRMING_ORDER:
+                executor.submit(handle, request_id, session_id, message)
+            else:
+                handle(request_id, session_id, message)
+    finally:
+        executor.shutdown(wait=True)
+        session_manager.close()
+        order_log.close()
+
+class ShardedChatServer(ChatServer):
+    """ChatServer yang meneruskan pesan ke beberapa proses worker
+
+    Sesi dibagi ke worker dengan consistent hashing atas session_id, sehingga state satu
+    sesi selalu ada di worker yang sama. Katalog dan index dibangun sekali sebelum fork
+    dan dipakai bersama (copy-on-write); nomor pesanan dari SharedOrderIdAllocator;
+    setiap worker menulis log pesanan sendiri (orders-w<N>.jsonl).
+    """
+    def __init__(self, menu_manager: Optional[MenuManager] = None, workers: int = os.cpu_count() or 1,
+                 host: str = "127.0.0.1", port: int = 8765, max_concurrency: int = 256,
+                 order_log_path: str = ORDER_LOG_PATH, id_block_size: int = 16,
+                 catalog_path: Optional[str] = None, outlet: Optional[str] = None, session_db_path: str = "",
+                 **kwargs):
+        # Di proses utama SessionManager hanya memegang katalog bersama; sesi hidup di worker
+        super().__init__(SessionManager(menu_manager or load_menu_manager(catalog_path, outlet)),
+                         host=host, port=port, max_concurrency=max_concurrency, **kwargs)
+        self.workers = workers
+        self.order_log_path = order_log_path
+        self.id_block_size = id_block_size
+        self.catalog_path = catalog_path
+        self.outlet = outlet
+        self.session_db_path = session_db_path
+        self.ring = HashRing(range(workers))
+        self._context = multiprocessing.get_context(
+            "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+        self._processes: List[Any] = []
+        self._connections: List[Any] = []
+        self._readers: List[threading.Thread] = []
+        self._kitchen_manager = None
+        self._request_ids = itertools.count()
+        self._pending: Dict[int, Tuple[asyncio.Future, int]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _start_workers(self):
+        menu_manager = self.session_manager.menu_manager
+        menu_manager._ensure_index()
+        
+        # Lanjutkan nomor pesanan dari log lama (mode satu proses maupun log per worker)
+        log_paths = [self.order_log_path] + [_shard_log_path(self.order_log_path, i) for i in range(self.workers)]
+        numbers = [number for number in map(JsonlOrderLog.read_last_number, log_paths) if number is not None]
+        id_allocator = SharedOrderIdAllocator(max(numbers, default=1000), self.id_block_size, self._context)
+        
+        self._kitchen_manager = _kitchen_manager_class()(ctx=self._context)
+        self._kitchen_manager.start()
+        kitchen = self._kitchen_manager.KitchenQueue()
+        
+        forked = self._context.get_start_method() == "fork"
+        # Bekukan objek yang sudah ada agar GC di worker tidak menyentuh (dan menyalin) halaman katalog
+        gc.freeze()
+        for index in range(self.workers):
+            parent_conn, child_conn = self._context.Pipe()
+            process = self._context.Process(
+                target=_run_shard_worker, name=f"kafe-shard-{index}", daemon=True,
+                args=(child_conn, menu_manager if forked else None, self.catalog_path, self.outlet,
+                      id_allocator, _shard_log_path(self.order_log_path, index), kitchen, self.session_db_path))
+            process.start()
+            child_conn.close()
+            self._processes.append(process)
+            self._connections.append(parent_conn)
+        gc.unfreeze()
+        
+        for index, conn in enumerate(self._connections):
+            reader = threading.Thread(target=self._read_responses, args=(index, conn),
+                                      name=f"kafe-shard-reader-{index}", daemon=True)
+            reader.start()
+            self._readers.append(reader)
+    
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._start_workers()
+        await super().start()
+    
+    async def close(self):
+        await super().close()
+        for conn in self._connections:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join()
+        for reader in self._readers:
+            reader.join()
+        for conn in self._connections:
+            conn.close()
+        if self._kitchen_manager is not None:
+            self._kitchen_manager.shutdown()
+    
+    def _read_responses(self, index: int, conn):
+        while True:
+            try:
+                response = conn.recv()
+            except (EOFError, OSError):
+                break
+            self._loop.call_soon_threadsafe(self._resolve, *response)
+        self._loop.call_soon_threadsafe(self._fail_worker, index)
+    
+    def _resolve(self, request_id: int, response: Optional[str], error: Optional[str]):
+        future, _ = self._pending.pop(request_id, (None, None))
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(response)
+    
+    def _fail_worker(self, index: int):
+        for request_id, (future, worker) in list(self._pending.items()):
+            if worker == index:
+                del self._pending[request_id]
+                if not future.done():
+                    future.set_exception(RuntimeError(f"Worker {index} berhenti"))
+    
+    async def _dispatch(self, session_id: str, message: str) -> str:
+        index = self.ring.node_for(session_id)
+        request_id = next(self._request_ids)
+        future = self._loop.create_future()
+        self._pending[request_id] = (future, index)
+        self._connections[index].send((request_id, session_id, message))
+        return await future
+    
+    async def _dispatch_stream(self, session_id: str, message: str, send):
+        # Worker menjawab per request, jadi balasan dikirim sebagai satu potongan
+        await send(await self._dispatch(session_id, message))
+
+
+def run_server(host: str = "127.0.0.1", port: int = 8765, max_concurrency: int = 64, order_log_path: str = ORDER_LOG_PATH):
+    """Menjalankan ChatServer sampai dihentikan (Ctrl+C)"""
+    _setup_metrics()
+    analytics = OrderAnalytics.from_log(order_log_path) if ANALYTICS_ENABLED else None
+    order_log = JsonlOrderLog(order_log_path, batch_size=ORDER_WORKERS)
+    order_sink = MultiOrderSink([order_log, analytics]) if analytics is not None else order_log
+    session_manager = SessionManager(load_menu_manager(CATALOG_PATH, CATALOG_OUTLET, SNAPSHOT_PATH), order_sink=order_sink,
+                                     kitchen=KitchenQueue(), store=_session_store())
+    server = ChatServer(session_manager, host=host, port=port, max_concurrency=max_concurrency, analytics=analytics)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print("\n👋 Server dihentikan")
+    finally:
+        session_manager.close()
+        order_log.close()
+
+def run_sharded_server(host: str = "127.0.0.1", port: int = 8765, workers: int = os.cpu_count() or 1,
+                       order_log_path: str = ORDER_LOG_PATH):
+    """Menjalankan ShardedChatServer dengan satu proses worker per core sampai dihentikan"""
+    server = ShardedChatServer(load_menu_manager(CATALOG_PATH, CATALOG_OUTLET, SNAPSHOT_PATH),
+                               workers=workers, host=host, port=port, order_log_path=order_log_path,
+                               catalog_path=CATALOG_PATH, outlet=CATALOG_OUTLET, session_db_path=SESSION_DB_PATH)
+    
+    async def serve():
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+    
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\n👋 Server dihentikan")
+
+def load_order_analytics(order_log_path: str = ORDER_LOG_PATH) -> OrderAnalytics:
+    """Analitik dari log pesanan utama ditambah log per worker mode sharded"""
+    paths = [order_log_path]
+    for index in itertools.count():
+        if not os.path.exists(_shard_log_path(order_log_path, index)):
+            break
+        paths.append(_shard_log_path(order_log_path, index))
+    return OrderAnalytics.from_log(*paths)
+
 def main():
     """Fungsi utama untuk menjalankan chatbot"""
-    chatbot = KafeChatbot()
+    _setup_metrics()
+    order_log = JsonlOrderLog(ORDER_LOG_PATH)
+    chatbot = KafeChatbot(load_menu_manager(CATALOG_PATH, CATALOG_OUTLET, SNAPSHOT_PATH),
+                          OrderManager(order_sink=order_log, kitchen=KitchenQueue()))
     
     # Start chatbot
     print(chatbot.start())
@@ -487,9 +3594,11 @@ def main():
             if not user_input:
                 continue
                 
-            # Process message
-            response = chatbot.process_message(user_input)
-            print(f"\n🤖 Bot: {response}")
+            # Process message; potongan balasan dicetak begitu jadi
+            print("\n🤖 Bot: ", end="", flush=True)
+            for chunk in chatbot.stream_message(user_input):
+                print(chunk, end="", flush=True)
+            print()
             
             # Check if user wants to quit
             if user_input.lower() in ['quit', 'q', 'keluar', 'exit']:
@@ -505,11 +3614,14 @@ def main():
         except Exception as e:
             print(f"\n❌ Error: {e}")
             print("Silakan coba lagi.")
+    
+    order_log.close()
 
 # Untuk testing interaktif
 class ChatbotTester:
     def __init__(self):
         self.chatbot = KafeChatbot()
+        self.failures = 0
         
     def test_flow(self):
         """Test flow chatbot"""
@@ -547,6 +3659,619 @@ class ChatbotTester:
         print(f"Bot: {response}")
         
         print("\n✅ Testing completed!")
+    
+    def _expect(self, label: str, actual: Any, expected: Any):
+        if actual == expected:
+            print(f"   ✅ {label}")
+        else:
+            self.failures += 1
+            print(f"   ❌ {label}: {actual!r} != {expected!r}")
+    
+    def test_parser(self):
+        """Span parser: jumlah, modifier, kata bilangan, sebutan ganda, batas 0 dan 99"""
+        print("\n🧪 PARSER")
+        menu_manager = self.chatbot.menu_manager
+        cases = [
+            ("2 latte 1 croissant", [("latte", 2, ("medium",)), ("croissant", 1, ("medium",))]),
+            ("latte 2 croissant 1", [("latte", 2, ("medium",)), ("croissant", 1, ("medium",))]),
+            ("latte oat besar 2 croissant", [("latte", 1, ("large", "oat")), ("croissant", 2, ("medium",))]),
+            ("saya mau 2 cappuccino large dan 1 sandwich", [("cappuccino", 2, ("large",)), ("sandwich", 1, ("medium",))]),
+            ("tambah 1 es kopi susu", [("es_kopi_susu", 1, ("medium",))]),
+            ("dua belas cake coklat", [("cake", 12, ("medium",))]),
+            ("2 cake coklat", [("cake", 2, ("medium",))]),
+            ("3 cookies choco", [("cookies", 3, ("medium",))]),
+            ("2 latte susu oat", [("latte", 2, ("medium", "oat"))]),
+            ("0 latte", [("latte", 1, ("medium",))]),
+            ("150 latte", [("latte", MAX_QUANTITY, ("medium",))]),
+            ("seratus latte", [("latte", MAX_QUANTITY, ("medium",))]),
+            ("latte 12345678901234567890", [("latte", MAX_QUANTITY, ("medium",))]),
+        ]
+        for text, expected in cases:
+            lines = [(line.item_id, line.quantity, line.modifiers) for line in parse_message(menu_manager, text).lines]
+            self._expect(repr(text), lines, expected)
+        
+        order_manager = OrderManager()
+        latte = menu_manager.get_item_by_id("latte")
+        order_manager.add_to_order(latte, 0)
+        self._expect("add_to_order menolak jumlah 0", len(order_manager.current_order.items), 0)
+        order_manager.add_to_order(latte, 60)
+        order_manager.add_to_order(latte, 60)
+        self._expect("add_to_order dibatasi MAX_QUANTITY", order_manager.current_order.items[0].quantity, MAX_QUANTITY)
+        order_manager.set_quantity(0, 5000)
+        self._expect("set_quantity dibatasi MAX_QUANTITY", order_manager.current_order.total, latte.price * MAX_QUANTITY)
+    
+    def test_session_codec(self):
+        """encode_session/decode_session bolak-balik dan data store yang rusak"""
+        print("\n🧪 SESSION STORE")
+        menu_manager = self.chatbot.menu_manager
+        order_manager = OrderManager()
+        order_manager.add_to_order(menu_manager.get_item_by_id("latte"), 2, ["large", "oat"], "tanpa gula")
+        order_manager.add_to_order(menu_manager.get_item_by_id("croissant"), 1)
+        session = SessionState(ChatbotState.CONFIRMING_ORDER, order_manager.current_order, ConversationHistory(), 0.0)
+        data = encode_session(session)
+        state, order = decode_session(data, menu_manager)
+        self._expect("state kembali utuh", state, ChatbotState.CONFIRMING_ORDER)
+        self._expect("baris keranjang kembali utuh",
+                     [(item.menu_item.id, item.quantity, item.modifiers, item.special_requests) for item in order.items],
+                     [(item.menu_item.id, item.quantity, item.modifiers, item.special_requests)
+                      for item in session.order.items])
+        self._expect("total dihitung ulang", order.total, session.order.total)
+        
+        for label, corrupt in (("terpotong di header", data[:6]), ("terpotong di baris", data[:12]),
+                               ("terpotong di teks", data[:-1]), ("kode state rusak", data[:1] + b"\xff" + data[2:])):
+            try:
+                decode_session(corrupt, menu_manager)
+                self._expect(f"{label} ditolak", "tidak ada error", "struct.error/ValueError")
+            except (struct.error, ValueError):
+                self._expect(f"{label} ditolak", True, True)
+        
+        store = MemorySessionStore()
+        store.save_many({"rusak": data[:12]})
+        session_manager = SessionManager(menu_manager, store=store)
+        response = session_manager.process_message("rusak", "lihat keranjang")
+        self._expect("sesi dengan data rusak mulai baru", response, "Pesanan masih kosong")
+        session_manager.end_session("rusak")
+        session_manager.close()
+        self._expect("data rusak dihapus dari store", store.load("rusak"), None)
+    
+    def test_order_log(self):
+        """Log pesanan: nomor terakhir setelah restart, urutan tidak teratur, dan rotasi segmen"""
+        print("\n🧪 ORDER LOG")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "orders.jsonl")
+            order_log = JsonlOrderLog(path, flush_interval=0.001, max_bytes=512)
+            # Nomor dialokasikan sebelum append, jadi pesanan bersamaan bisa tertulis tidak urut
+            for number in list(range(1001, 1040)) + [1045, 1041, 1044, 1042]:
+                order_log.wait(order_log.append({"order_number": number, "total": 28000}))
+            order_log.close()
+            self._expect("log dirotasi ke beberapa segmen", len(JsonlOrderLog._segment_paths(path)) > 0, True)
+            self._expect("nomor tertinggi terbaca setelah restart", JsonlOrderLog.read_last_number(path), 1045)
+            with open(path, "ab") as f:
+                f.write(b'{"order_number": 10')  # Tulisan terakhir yang terpotong saat crash
+            reopened = JsonlOrderLog(path)
+            self._expect("baris terpotong diabaikan", reopened.last_order_number(), 1045)
+            order_manager = OrderManager(order_sink=reopened)
+            order_manager.add_to_order(self.chatbot.menu_manager.get_item_by_id("latte"), 1)
+            self._expect("nomor pesanan berlanjut", order_manager.place_order("Budi")["order_id"], "ORD-1046")
+            reopened.close()
+            compacted = JsonlOrderLog(path)
+            removed = compacted.compact(keep_segments=1)
+            compacted.close()
+            self._expect("compact menyisakan satu segmen", len(JsonlOrderLog._segment_paths(path)), 1)
+            self._expect("compact menghapus segmen lama", removed > 0, True)
+            self._expect("nomor tetap terbaca setelah compact", JsonlOrderLog.read_last_number(path), 1046)
+    
+    def test_parse_batch(self):
+        """parse_batch dengan worker menjaga urutan pesan per sesi"""
+        print("\n🧪 PARSE BATCH")
+        menu_manager = self.chatbot.menu_manager
+        messages = [(f"s{i % 7}", f"{i % 5 + 1} {name}") for i, name in
+                    enumerate(["latte", "croissant", "cappuccino large", "es kopi susu", "sandwich"] * 20)]
+        
+        def by_session(results: Iterable[Tuple[str, ParsedMessage]]) -> Dict[str, List[ParsedMessage]]:
+            grouped: Dict[str, List[ParsedMessage]] = {}
+            for session_id, parsed in results:
+                grouped.setdefault(session_id, []).append(parsed)
+            return grouped
+        
+        expected = by_session(parse_batch(messages, menu_manager))
+        actual = by_session(parse_batch(messages, menu_manager, workers=2, chunk_size=16))
+        self._expect("urutan per sesi sama dengan parse serial", actual, expected)
+    
+    def run_checks(self) -> int:
+        """Menjalankan semua pengujian perilaku; mengembalikan jumlah yang gagal"""
+        self.failures = 0
+        self.test_parser()
+        self.test_session_codec()
+        self.test_order_log()
+        self.test_parse_batch()
+        print(f"\n{'✅ Semua pengujian lolos' if not self.failures else f'❌ {self.failures} pengujian gagal'}")
+        return self.failures
+
+class ChatbotBenchmark:
+    """Benchmark komponen chatbot (hasil dicetak dan dikembalikan sebagai dict)"""
+    SYLLABLES = ["ka", "ri", "mo", "la", "te", "su", "ba", "no", "ve", "pi", "ro", "gu", "da", "me", "sa", "lo"]
+    
+    def __init__(self, seed: int = 42):
+        self.seed = seed
+        self.menu_manager = MenuManager()
+    
+    def synthetic_menu(self, size: int) -> MenuManager:
+        """MenuManager bawaan ditambah item sintetis sampai berjumlah size"""
+        rng = random.Random(self.seed)
+        menu_manager = MenuManager()
+        categories = list(CATEGORY_NAMES)
+        names = set()
+        while len(menu_manager.menu) < size:
+            words = ["".join(rng.choice(self.SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(2)]
+            name = " ".join(word.capitalize() for word in words)
+            if name.lower() in names:
+                continue
+            names.add(name.lower())
+            item_id = f"sku_{len(menu_manager.menu)}"
+            menu_manager.add_item(MenuItem(item_id, name, rng.randrange(8000, 60000, 500), rng.choice(categories),
+                                           f"Menu sintetis {name}"))
+        return menu_manager
+    
+    @staticmethod
+    def _typo(word: str, rng: random.Random) -> str:
+        if len(word) < 5:
+            return word
+        i = rng.randrange(1, len(word) - 1)
+        kind = rng.random()
+        if kind < 0.4:
+            return word[:i] + word[i + 1:]  # huruf hilang
+        if kind < 0.7:
+            return word[:i] + word[i] + word[i:]  # huruf dobel
+        return word[:i - 1] + word[i] + word[i - 1] + word[i + 1:]  # huruf tertukar
+    
+    def generate_conversations(self, count: int, menu_manager: MenuManager) -> List[List[str]]:
+        """Percakapan sintetis (seeded): lihat menu, pesan multi-item, typo, modifier, konfirmasi/batal"""
+        rng = random.Random(self.seed)
+        items = menu_manager.get_all_menu()
+        modifier_words = ["large", "kecil", "oat", "soy", "tanpa gula", "panas", "dingin", "extra manis"]
+        names = ["Budi", "Ani", "Sari", "Dewi", "Rudi", "Joko"]
+        conversations = []
+        for _ in range(count):
+            messages = []
+            if rng.random() < 0.6:
+                messages.append(rng.choice(["menu", "lihat daftar menu", "menu kopi", "menu snack"]))
+            for _ in range(rng.randint(1, 3)):
+                parts = []
+                for _ in range(rng.randint(1, 3)):
+                    name = rng.choice(items).name.lower()
+                    if rng.random() < 0.2:
+                        name = " ".join(self._typo(word, rng) for word in name.split())
+                    part = f"{rng.randint(1, 4)} {name}"
+                    if rng.random() < 0.5:
+                        part += " " + rng.choice(modifier_words)
+                    parts.append(part)
+                messages.append("saya mau " + " dan ".join(parts))
+            if rng.random() < 0.3:
+                messages.append("lihat keranjang")
+            messages.append("konfirmasi")
+            outcome = rng.random()
+            if outcome < 0.7:
+                messages.append(f"ya, {rng.choice(names)}")
+            elif outcome < 0.85:
+                messages.extend(["tidak", "hapus semua"])
+            else:
+                messages.extend(["tidak", f"tambah 1 {rng.choice(items).name.lower()}", "konfirmasi", "ok"])
+            conversations.append(messages)
+        return conversations
+    
+    @staticmethod
+    def _stats(samples_ns: List[int]) -> Dict[str, float]:
+        """Persentil latensi (mikrodetik) dan throughput dari sampel nanodetik"""
+        ordered = sorted(samples_ns)
+        n = len(ordered)
+        
+        def percentile(p: float) -> float:
+            return ordered[min(n - 1, int(p * n))] / 1000
+        
+        return {
+            "p50_us": percentile(0.50),
+            "p95_us": percentile(0.95),
+            "p99_us": percentile(0.99),
+            "per_sec": n / (sum(ordered) / 1e9) if sum(ordered) else float("inf"),
+            "count": n,
+        }
+    
+    @staticmethod
+    def _print_stats(label: str, stats: Dict[str, float]):
+        print(f"   {label:<28} p50 {stats['p50_us']:>9.1f}µs  p95 {stats['p95_us']:>9.1f}µs  "
+              f"p99 {stats['p99_us']:>9.1f}µs  {stats['per_sec']:>10,.0f}/dtk")
+    
+    def conversation_load(self, menu_manager: MenuManager, conversations: int = 300) -> Dict[str, float]:
+        """Latensi per pesan, pesan per detik, dan alokasi per pesan untuk percakapan sintetis"""
+        script = self.generate_conversations(conversations, menu_manager)
+        
+        def run(traced: bool = False) -> List[int]:
+            session_manager = SessionManager(menu_manager)
+            samples = []
+            for i, messages in enumerate(script):
+                for message in messages:
+                    if traced:
+                        # Puncak memori di atas awal pesan = byte yang dialokasikan pesan ini,
+                        # termasuk objek sementara yang sudah dibebaskan saat pesan selesai
+                        tracemalloc.reset_peak()
+                        start = tracemalloc.get_traced_memory()[0]
+                        session_manager.process_message(f"bench-{i}", message)
+                        samples.append(tracemalloc.get_traced_memory()[1] - start)
+                    else:
+                        start = time.perf_counter_ns()
+                        session_manager.process_message(f"bench-{i}", message)
+                        samples.append(time.perf_counter_ns() - start)
+            return samples
+        
+        run()  # Pemanasan: index, cache render, dll.
+        # Pemanasan memakai skrip yang sama, jadi cache parse dikosongkan agar pass terukur
+        # tidak sekadar mengulang hasil parse pemanasan
+        menu_manager.parse_cache.clear()
+        menu_manager.parse_cache.hits = menu_manager.parse_cache.misses = 0
+        samples = run()
+        stats = self._stats(samples)
+        stats["parse_cache_hit_rate"] = menu_manager.parse_cache.stats()["hit_rate"]
+        
+        # Pass terpisah dengan tracemalloc agar overhead tracing tidak memengaruhi latensi
+        menu_manager.parse_cache.clear()
+        tracemalloc.start()
+        allocated = sorted(run(traced=True))
+        stats["peak_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+        stats["alloc_kb_per_msg"] = sum(allocated) / len(allocated) / 1024
+        stats["alloc_kb_p95"] = allocated[min(len(allocated) - 1, int(0.95 * len(allocated)))] / 1024
+        return stats
+    
+    @staticmethod
+    def _time_calls(function, iterations: int, setup=None) -> List[int]:
+        samples = []
+        for _ in range(iterations):
+            if setup is not None:
+                setup()
+            start = time.perf_counter_ns()
+            function()
+            samples.append(time.perf_counter_ns() - start)
+        return samples
+    
+    def handler_latency(self, menu_manager: MenuManager, iterations: int = 300) -> Dict[str, Dict[str, float]]:
+        """Latensi tiap handler utama secara terpisah"""
+        rng = random.Random(self.seed)
+        items = menu_manager.get_all_menu()
+        chatbot = KafeChatbot(menu_manager)
+        order_texts = [f"{rng.randint(1, 3)} {rng.choice(items).name.lower()} dan 1 {rng.choice(items).name.lower()} large"
+                       for _ in range(iterations)]
+        texts = iter(order_texts * 2)
+        results = {}
+        
+        def reset_order():
+            chatbot.order_manager.clear_order()
+        
+        results["_process_order_request"] = self._stats(self._time_calls(
+            lambda: chatbot._process_order_request(next(texts)), iterations, reset_order))
+        
+        results["_show_menu (cache)"] = self._stats(self._time_calls(chatbot._show_menu, iterations))
+        results["_show_menu (tanpa cache)"] = self._stats(self._time_calls(
+            chatbot._show_menu, max(1, iterations // 10), menu_manager._render_cache.clear))
+        
+        def fill_cart():
+            chatbot.order_manager.clear_order()
+            for item in rng.sample(items, min(10, len(items))):
+                chatbot.order_manager.add_to_order(item, rng.randint(1, 3), ["medium"])
+        
+        results["get_order_summary"] = self._stats(self._time_calls(
+            chatbot.order_manager.get_order_summary, iterations, fill_cart))
+        
+        def prepare_finalize():
+            fill_cart()
+            chatbot.state = ChatbotState.CONFIRMING_ORDER
+            chatbot.conversation_history.append("ya Budi")
+        
+        results["_finalize_order"] = self._stats(self._time_calls(chatbot._finalize_order, iterations, prepare_finalize))
+        return results
+    
+    def run_suite(self, catalog_sizes: Tuple[int, ...] = (23, 1000, 10000), conversations: int = 300):
+        """Menjalankan seluruh benchmark untuk beberapa ukuran katalog"""
+        report = {}
+        for size in catalog_sizes:
+            menu_manager = self.synthetic_menu(size)
+            print(f"\n📊 Katalog {len(menu_manager.menu)} item")
+            load = self.conversation_load(menu_manager, conversations)
+            self._print_stats("pesan (percakapan sintetis)", load)
+            print(f"   {'':<28} alokasi {load['alloc_kb_per_msg']:.1f} KB/pesan (p95 {load['alloc_kb_p95']:.1f} KB), "
+                  f"puncak memori {load['peak_kb']:,.0f} KB, hit rate cache parse {load['parse_cache_hit_rate']:.0%}")
+            handlers = self.handler_latency(menu_manager)
+            for name, stats in handlers.items():
+                self._print_stats(name, stats)
+            report[size] = {"conversation": load, "handlers": handlers}
+        return report
+    
+    def kitchen_rush(self, orders_per_hour: int = 60, hours: float = 2.0, batching: bool = True) -> Dict[str, float]:
+        """Simulasi jam sibuk: pesanan Poisson masuk ke KitchenQueue dengan jam simulasi
+
+        Mengukur throughput dapur, waktu tunggu pesanan, selisih ETA, dan biaya operasi antrian.
+        """
+        rng = random.Random(self.seed)
+        items = self.menu_manager.get_all_menu()
+        stations = KITCHEN_STATIONS if batching else {
+            name: replace(config, batch_size=1) for name, config in KITCHEN_STATIONS.items()}
+        arrivals: Dict[str, float] = {}
+        etas: Dict[str, float] = {}
+        done: Dict[str, float] = {}
+        submit_ns: List[int] = []
+        units = 0
+        
+        def record(batch: KitchenBatch):
+            for ticket in batch.tickets:
+                done[ticket.order_id] = max(done.get(ticket.order_id, 0.0), batch.end)
+        
+        kitchen = KitchenQueue(stations, on_start=record)
+        
+        now = 0.0
+        order_number = 0
+        while True:
+            now += rng.expovariate(orders_per_hour / 3600)
+            if now > hours * 3600:
+                break
+            order_number += 1
+            order_id = f"SIM-{order_number}"
+            lines = []
+            for _ in range(rng.randint(1, 3)):
+                item = rng.choice(items)
+                quantity = rng.randint(1, 3)
+                modifiers = ["large"] if rng.random() < 0.2 else ["medium"]
+                lines.append(OrderItem(item, quantity, encode_modifiers(modifiers)))
+                units += quantity
+            kitchen.advance(now)
+            start = time.perf_counter_ns()
+            etas[order_id] = kitchen.submit(order_id, lines, now=now)
+            submit_ns.append(time.perf_counter_ns() - start)
+            arrivals[order_id] = now
+        kitchen.advance(float("inf"))
+        
+        waits = sorted(done[order_id] - arrivals[order_id] for order_id in arrivals)
+        errors = sorted(abs(done[order_id] - arrivals[order_id] - etas[order_id]) for order_id in arrivals)
+        span = max(done.values()) - min(arrivals.values())
+        n = len(waits)
+        result = {
+            "orders": n,
+            "orders_per_hour": n / span * 3600,
+            "units_per_hour": units / span * 3600,
+            "wait_p50_min": waits[n // 2] / 60,
+            "wait_p95_min": waits[min(n - 1, int(0.95 * n))] / 60,
+            "eta_error_p50_min": errors[n // 2] / 60,
+            "submit": self._stats(submit_ns),
+        }
+        label = "dengan batch" if batching else "tanpa batch"
+        print(f"👨‍🍳 Simulasi dapur {label} ({orders_per_hour} pesanan/jam, {hours:g} jam, {n} pesanan)")
+        print(f"   Throughput: {result['orders_per_hour']:,.0f} pesanan/jam, {result['units_per_hour']:,.0f} porsi/jam")
+        print(f"   Waktu tunggu p50 {result['wait_p50_min']:.1f} menit, p95 {result['wait_p95_min']:.1f} menit, "
+              f"selisih ETA p50 {result['eta_error_p50_min']:.1f} menit")
+        self._print_stats("submit (enqueue + ETA)", result["submit"])
+        return result
+    
+    def sharded_throughput(self, worker_counts: Tuple[int, ...] = (1, 2, 4), conversations: int = 400,
+                           connections: int = 8) -> Dict[int, float]:
+        """Pesan per detik lewat ShardedChatServer (TCP lokal) untuk beberapa jumlah worker"""
+        script = self.generate_conversations(conversations, self.menu_manager)
+        
+        async def client(server: ShardedChatServer, sessions: List[Tuple[str, List[str]]]) -> int:
+            reader, writer = await asyncio.open_connection(server.host, server.port)
+            requests = [(session_id, message) for session_id, messages in sessions for message in messages]
+            
+            async def send():
+                for session_id, message in requests:
+                    writer.write((json.dumps({"session_id": session_id, "message": message}) + "\n").encode("utf-8"))
+                    await writer.drain()
+            
+            async def receive():
+                for _ in requests:
+                    await reader.readline()
+            
+            await asyncio.gather(send(), receive())
+            writer.close()
+            await writer.wait_closed()
+            return len(requests)
+        
+        async def drive(workers: int, log_dir: str) -> float:
+            server = ShardedChatServer(self.menu_manager, workers=workers, port=0,
+                                       order_log_path=os.path.join(log_dir, "orders.jsonl"))
+            await server.start()
+            try:
+                sessions = [(f"shard-{i}", messages) for i, messages in enumerate(script)]
+                start = time.perf_counter()
+                counts = await asyncio.gather(*(client(server, sessions[i::connections]) for i in range(connections)))
+                return sum(counts) / (time.perf_counter() - start)
+            finally:
+                await server.close()
+        
+        results = {}
+        print(f"🔀 Server sharded ({conversations} percakapan, {connections} koneksi, {os.cpu_count()} core)")
+        for workers in worker_counts:
+            with tempfile.TemporaryDirectory() as log_dir:
+                results[workers] = asyncio.run(drive(workers, log_dir))
+            print(f"   {workers} worker: {results[workers]:,.0f} pesan/dtk "
+                  f"({results[workers] / results[worker_counts[0]]:.2f}x)")
+        return results
+    
+    def startup(self, catalog_sizes: Tuple[int, ...] = (23, 10000), repeats: int = 5) -> Dict[str, Any]:
+        """Waktu start-up (ms): bangun MenuManager + index dari katalog vs muat snapshot
+
+        Keduanya diukur sampai pesan pertama selesai diparse. Waktu impor modul diukur di
+        proses baru, karena di proses ini subsistem yang di-lazy-import sudah termuat.
+        """
+        def median_ms(function) -> float:
+            samples = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                function()
+                samples.append((time.perf_counter() - start) * 1000)
+            return sorted(samples)[len(samples) // 2]
+        
+        import subprocess
+        script = ("import importlib.util, sys, time; start = time.perf_counter(); "
+                  f"spec = importlib.util.spec_from_file_location('chatbot', {os.path.abspath(__file__)!r}); "
+                  "module = importlib.util.module_from_spec(spec); sys.modules['chatbot'] = module; "
+                  "spec.loader.exec_module(module); print((time.perf_counter() - start) * 1000)")
+        import_ms = sorted(float(subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                                                check=True).stdout) for _ in range(repeats))[repeats // 2]
+        print(f"🚀 Start-up: impor modul {import_ms:.1f} ms (proses baru)")
+        
+        results: Dict[str, Any] = {"import_ms": import_ms, "catalogs": {}}
+        with tempfile.TemporaryDirectory() as directory:
+            for size in catalog_sizes:
+                source = self.synthetic_menu(size)
+                catalog_path = os.path.join(directory, f"menu_{size}.json")
+                with open(catalog_path, "w", encoding="utf-8") as f:
+                    json.dump([{"id": item.id, "name": item.name, "price": item.price, "category": item.category,
+                                "description": item.description, "prep_time": item.prep_time}
+                               for item in source.menu.values()], f)
+                snapshot_path = os.path.join(directory, f"menu_{size}.snap")
+                load_menu_manager(catalog_path)  # Kompilasi .kcat sekali, seperti deployment biasa
+                save_snapshot(load_menu_manager(catalog_path), snapshot_path, catalog_path)
+                
+                def cold():
+                    menu_manager = load_menu_manager(catalog_path)
+                    parse_message(menu_manager, "2 latte oat dan 1 croissant")
+                
+                def warm():
+                    menu_manager = load_snapshot(snapshot_path, catalog_path)
+                    parse_message(menu_manager, "2 latte oat dan 1 croissant")
+                
+                result = results["catalogs"][size] = {
+                    "cold_ms": median_ms(cold), "snapshot_ms": median_ms(warm),
+                    "snapshot_kb": os.path.getsize(snapshot_path) / 1024}
+                print(f"   Katalog {size:>6} item: bangun {result['cold_ms']:8.1f} ms, "
+                      f"snapshot {result['snapshot_ms']:8.1f} ms ({result['cold_ms'] / result['snapshot_ms']:.1f}x, "
+                      f"{result['snapshot_kb']:,.0f} KB)")
+        return results
+    
+    def analytics_queries(self, line_counts: Tuple[int, ...] = (1_000_000, 10_000_000), menu_size: int = 1000,
+                          repeats: int = 3) -> Dict[int, Dict[str, float]]:
+        """Latensi query OrderAnalytics (ms) atas baris pesanan sintetis
+
+        Kolom dibangkitkan langsung dengan numpy lalu dimasukkan lewat jalur append blok
+        yang sama dengan from_log, agar ukuran puluhan juta baris tetap cepat disiapkan.
+        """
+        items = self.synthetic_menu(menu_size).get_all_menu()
+        prices = np.array([item.price for item in items], dtype=np.int32)
+        # Popularitas item mengikuti distribusi Zipf seperti penjualan sungguhan
+        weights = 1.0 / np.arange(1, len(items) + 1)
+        weights /= weights.sum()
+        queries = {
+            "revenue_by_item": lambda analytics: analytics.revenue_by_item(),
+            "revenue_by_category": lambda analytics: analytics.revenue_by_category(),
+            "revenue_by_hour": lambda analytics: analytics.revenue_by_hour(7),
+            "top_items(10)": lambda analytics: analytics.top_items(10),
+            "co_occurrence": lambda analytics: analytics.co_occurrence(top=10),
+            "co_occurrence(item)": lambda analytics: analytics.co_occurrence(items[0].id),
+        }
+        results = {}
+        for line_count in line_counts:
+            rng = np.random.default_rng(self.seed)
+            analytics = OrderAnalytics()
+            codes = [analytics._code(analytics._item_codes, analytics._item_ids, item.id) for item in items]
+            category_codes = np.array([analytics._code(analytics._category_codes, analytics._categories, item.category)
+                                       for item in items], dtype=np.int16)
+            start = time.perf_counter()
+            chunk = 1_000_000
+            started_at = time.time() - 30 * 86400
+            for offset in range(0, line_count, chunk):
+                lines = min(chunk, line_count - offset)
+                basket_sizes = rng.integers(1, 5, size=lines // 2)
+                basket_sizes = basket_sizes[np.cumsum(basket_sizes) <= lines]
+                lines = int(basket_sizes.sum())
+                line_order = np.repeat(np.arange(len(basket_sizes), dtype=np.int32), basket_sizes)
+                item_codes = np.asarray(codes, dtype=np.int32)[rng.choice(len(items), size=lines, p=weights)]
+                analytics._append_columns(
+                    np.arange(len(basket_sizes)) + analytics.order_count + 1001,
+                    started_at + np.sort(rng.uniform(0, 30 * 86400, size=len(basket_sizes))),
+                    line_order, item_codes, rng.integers(1, 4, size=lines), prices[item_codes],
+                    category_codes[item_codes])
+            load_s = time.perf_counter() - start
+            megabytes = sum(getattr(analytics, name)[:analytics.line_count].nbytes
+                            for name, _ in OrderAnalytics._LINE_COLUMNS) / 2 ** 20
+            print(f"📊 Analitik {analytics.line_count:,} baris / {analytics.order_count:,} pesanan "
+                  f"(muat {load_s:.1f} s, {megabytes:,.0f} MB kolom baris)")
+            timings = results[line_count] = {}
+            for label, query in queries.items():
+                samples = []
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    query(analytics)
+                    samples.append((time.perf_counter() - start) * 1000)
+                timings[label] = sorted(samples)[len(samples) // 2]
+                print(f"   {label:<22} {timings[label]:10.1f} ms")
+        return results
+    
+    def _random_lines(self, rng: random.Random, count: int) -> List[Tuple[MenuItem, int, List[str]]]:
+        items = self.menu_manager.get_all_menu()
+        lines = []
+        for _ in range(count):
+            modifiers = [rng.choice(MODIFIER_GROUPS["ukuran"])]
+            if rng.random() < 0.4:
+                modifiers.append(rng.choice(MODIFIER_GROUPS["susu"]))
+            if rng.random() < 0.5:
+                modifiers.append(rng.choice(["panas", "dingin"]))
+            lines.append((rng.choice(items), rng.randint(1, 3), modifiers))
+        return lines
+    
+    def cart_memory(self, carts: int = 10000, lines_per_cart: int = 4) -> Dict[str, float]:
+        """Membandingkan byte per keranjang: dataclass biasa + list modifier vs slots + bitmask"""
+        # Representasi lama, disalin untuk pembanding
+        @dataclass
+        class LegacyOrderItem:
+            menu_item: MenuItem
+            quantity: int = 1
+            modifiers: List[str] = field(default_factory=list)
+            special_requests: str = ""
+        
+        @dataclass
+        class LegacyOrder:
+            items: List[LegacyOrderItem] = field(default_factory=list)
+            customer_name: str = ""
+            total: float = 0.0
+            order_id: str = ""
+        
+        rng = random.Random(self.seed)
+        cart_lines = [self._random_lines(rng, lines_per_cart) for _ in range(carts)]
+        
+        def build_legacy():
+            result = []
+            for lines in cart_lines:
+                order = LegacyOrder()
+                for item, quantity, modifiers in lines:
+                    order.items.append(LegacyOrderItem(item, quantity, list(modifiers)))
+                    order.total += item.price * quantity
+                result.append(order)
+            return result
+        
+        def build_compact():
+            # Keranjang diukur setelah ringkasannya ditampilkan, termasuk cache render_line
+            render_line.cache_clear()
+            result = []
+            for lines in cart_lines:
+                order_manager = OrderManager()
+                for item, quantity, modifiers in lines:
+                    order_manager.add_to_order(item, quantity, modifiers)
+                order_manager.get_order_summary()
+                result.append(order_manager.current_order)
+            return result
+        
+        results = {}
+        for label, build in (("sebelum", build_legacy), ("sesudah", build_compact)):
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            orders = build()
+            used = tracemalloc.get_traced_memory()[0] - baseline
+            tracemalloc.stop()
+            del orders
+            results[label] = used / carts
+        
+        print(f"🧠 Memori per keranjang ({carts} keranjang x {lines_per_cart} baris)")
+        print(f"   Sebelum (dataclass + list modifier): {results['sebelum']:,.0f} byte")
+        print(f"   Sesudah (slots + bitmask modifier) : {results['sesudah']:,.0f} byte")
+        return results
 
 if __name__ == "__main__":
     print("🤖 KAFE DIGITAL CHATBOT SYSTEM")
@@ -554,11 +4279,44 @@ if __name__ == "__main__":
     print("Pilihan:")
     print("1. Jalankan chatbot interaktif")
     print("2. Test flow chatbot")
+    print("3. Jalankan server (asyncio, JSON per baris)")
+    print("4. Benchmark")
+    print("5. Parse batch transkrip dari file")
+    print("6. Jalankan server multi-proses (sharded)")
+    print("7. Laporan penjualan dari log pesanan")
     
-    choice = input("\nPilih (1/2): ").strip()
+    choice = input("\nPilih (1/2/3/4/5/6/7): ").strip()
     
     if choice == "2":
         tester = ChatbotTester()
         tester.test_flow()
+        if tester.run_checks():
+            sys.exit(1)
+    elif choice == "3":
+        run_server()
+    elif choice == "4":
+        benchmark = ChatbotBenchmark()
+        benchmark.run_suite()
+        benchmark.cart_memory()
+        benchmark.kitchen_rush(batching=False)
+        benchmark.kitchen_rush()
+        benchmark.sharded_throughput()
+        benchmark.startup()
+        if np is not None:
+            benchmark.analytics_queries()
+    elif choice == "5":
+        input_path = input("File transkrip: ").strip()
+        output_path = input("File hasil (JSON per baris): ").strip() or "parsed.jsonl"
+        count = parse_file(input_path, output_path)
+        print(f"✅ {count} pesan diparse ke {output_path}")
+    elif choice == "6":
+        run_sharded_server()
+    elif choice == "7":
+        analytics = load_order_analytics()
+        print(analytics.report(load_menu_manager(CATALOG_PATH, CATALOG_OUTLET, SNAPSHOT_PATH)))
+        export_path = input("\nEkspor ke file .csv/.parquet (kosong = lewati): ").strip()
+        if export_path:
+            export = analytics.export_parquet if export_path.endswith(".parquet") else analytics.export_csv
+            print(f"✅ {export(export_path)} baris diekspor ke {export_path}")
     else:
         main()